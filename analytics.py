@@ -0,0 +1,483 @@
+"""Price statistics across shops, computed in bulk on columnar NumPy arrays.
+
+Offers from the offer store (or scraped for a card list first) are loaded into one
+array per field, with strings replaced by integer codes. Every statistic is then a
+handful of sorts and reductions over those arrays instead of a loop over dicts, so a
+million offers take seconds.
+
+Statistics per group (card, set or scraper) and currency, over in-stock sell offers.
+Prices in different currencies are never compared, a card sold in USD and in EUR gets
+a row for each:
+    offers, shops         number of offers and of distinct shops
+    min, median, max      price, any condition and finish
+    spread                max - min
+    foil_premium          median foil price / median non foil price - 1
+    adjusted_median       median non foil price converted to near mint with
+                          CONDITION_FACTORS
+    price_index           median of each offer's near mint price over its card's median,
+                          above 1 when the group prices above the market
+
+Example, everything in the offer store, by shop:
+    python analytics.py --by scraper
+
+Example, scrape a list first, then export:
+    python analytics.py inventory.csv --csv summary.csv --export offers.npz
+
+Needs NumPy (pip install numpy).
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import time
+from array import array
+from itertools import islice
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only this module needs it
+    np = None
+
+from app_logging import configure_logging, get_logger
+from offer_model import format_price, normalize_condition
+from offer_store import OfferStore
+from price_aggregator import is_in_stock, parse_price
+from utils import get_cache_dir
+
+logger = get_logger("analytics")
+
+# Price of a copy in this condition relative to near mint, to compare offers of
+# different conditions. Keyed by normalize_condition() codes, others count as near mint
+CONDITION_FACTORS = {
+    "nm": 1.0,
+    "lp": 0.85,
+    "mp": 0.7,
+    "hp": 0.5,
+    "dmg": 0.35,
+}
+
+# Groupings of analyze(), each one is a code column of OfferColumns
+GROUP_BY = ("card", "set", "scraper")
+
+STAT_COLUMNS = (
+    "offers",
+    "shops",
+    "min",
+    "median",
+    "max",
+    "spread",
+    "foil_premium",
+    "adjusted_median",
+    "price_index",
+)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("Price analytics need NumPy, install it with: pip install numpy")
+
+
+class OfferColumns(NamedTuple):
+    """Offers as parallel arrays, one entry per offer.
+
+    card, set, scraper, condition and currency are int32 codes into the matching
+    `labels` list.
+    """
+
+    card: "np.ndarray"
+    set: "np.ndarray"
+    scraper: "np.ndarray"
+    condition: "np.ndarray"
+    currency: "np.ndarray"
+    foil: "np.ndarray"
+    in_stock: "np.ndarray"
+    price: "np.ndarray"
+    # column -> list of the strings behind the codes
+    labels: dict
+    # Card name per card code
+    card_names: list
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+
+class ColumnBuilder:
+    """Collects sell offers row by row into compact arrays, then hands out OfferColumns.
+
+    Strings are turned into codes as they come in, so memory stays at a few bytes per
+    offer whatever the number of distinct cards and shops.
+    """
+
+    def __init__(self):
+        self._codes = {
+            column: {} for column in ("card", "set", "scraper", "condition", "currency")
+        }
+        self._columns = {column: array("i") for column in self._codes}
+        self._foil = array("b")
+        self._in_stock = array("b")
+        self._price = array("d")
+        self._names = {}
+        # Raw condition -> code, skips normalizing the same strings again
+        self._raw_conditions = {}
+
+    def _code(self, column: str, value) -> int:
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def _codes_of(self, column: str, values: tuple) -> list:
+        codes = self._codes[column]
+        return [codes[v] if v in codes else codes.setdefault(v, len(codes)) for v in values]
+
+    def _condition_codes(self, conditions: tuple) -> list:
+        raw = self._raw_conditions
+        for condition in set(conditions).difference(raw):
+            raw[condition] = self._codes_of("condition", (normalize_condition(condition),))[0]
+        return [raw[c] for c in conditions]
+
+    def extend(self, rows: list) -> None:
+        """Adds OfferStore.price_rows() tuples, a column at a time.
+
+        Buylist offers and offers without a price are skipped.
+        """
+        rows = [row for row in rows if row[6] is not None and row[8] != "buy"]
+        if not rows:
+            return
+        card_ids, scrapers, names, sets, conditions, foils, prices, in_stock, _, currencies = zip(
+            *rows
+        )
+        cards = self._codes_of("card", card_ids)
+        for card, name, card_id in zip(cards, names, card_ids):
+            if card not in self._names:
+                self._names[card] = name or card_id
+        self._columns["card"].extend(cards)
+        self._columns["set"].extend(self._codes_of("set", [s or "" for s in sets]))
+        self._columns["scraper"].extend(self._codes_of("scraper", scrapers))
+        self._columns["condition"].extend(self._condition_codes(conditions))
+        self._columns["currency"].extend(self._codes_of("currency", [c or "" for c in currencies]))
+        self._foil.extend(map(bool, foils))
+        self._in_stock.extend(map(bool, in_stock))
+        self._price.extend(prices)
+
+    def add(self, card_id: str, offers: list) -> None:
+        """Adds the offers of one fetch_seller_info() answer"""
+        self.extend(
+            [
+                (
+                    card_id,
+                    offer.get("scraperId"),
+                    offer.get("name"),
+                    offer.get("set_name"),
+                    offer.get("condition"),
+                    offer.get("foil"),
+                    parse_price(offer.get("price")),
+                    is_in_stock(offer),
+                    offer.get("type"),
+                    offer.get("currency"),
+                )
+                for offer in offers or []
+            ]
+        )
+
+    def build(self) -> OfferColumns:
+        _require_numpy()
+        labels = {column: list(codes) for column, codes in self._codes.items()}
+        return OfferColumns(
+            # Copies, so the builder can keep growing
+            *(np.frombuffer(self._columns[c], dtype=np.int32).copy() for c in self._codes),
+            foil=np.frombuffer(self._foil, dtype=np.int8).astype(bool),
+            in_stock=np.frombuffer(self._in_stock, dtype=np.int8).astype(bool),
+            price=np.frombuffer(self._price, dtype=np.float64).copy(),
+            labels=labels,
+            card_names=[self._names[i] for i in range(len(labels["card"]))],
+        )
+
+
+def load_store(store: OfferStore, card_ids: list = None, max_age: float = None) -> OfferColumns:
+    """Loads stored offers, see OfferStore.price_rows() for the arguments"""
+    builder = ColumnBuilder()
+    rows = store.price_rows(card_ids, max_age)
+    while True:
+        chunk = list(islice(rows, 10000))
+        if not chunk:
+            return builder.build()
+        builder.extend(chunk)
+
+
+def _group_stats(codes, values, groups: int) -> tuple:
+    """Count, min, median and max of `values` per code, NaN for empty groups"""
+    order = np.lexsort((values, codes))
+    values = values[order]
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.cumsum(counts) - counts
+    nonempty = counts > 0
+    first = starts[nonempty]
+    last = first + counts[nonempty] - 1
+
+    mins = np.full(groups, np.nan)
+    medians = np.full(groups, np.nan)
+    maxs = np.full(groups, np.nan)
+    mins[nonempty] = values[first]
+    maxs[nonempty] = values[last]
+    medians[nonempty] = (values[(first + last) // 2] + values[(first + last + 1) // 2]) / 2
+    return counts, mins, medians, maxs
+
+
+class PriceSummary(NamedTuple):
+    """Output of analyze(), one entry per group in every stats array"""
+
+    by: str
+    labels: list
+    # Currency of every group's prices, a label can come once per currency
+    currencies: list
+    # STAT_COLUMNS name -> array
+    stats: dict
+
+    def rows(self):
+        """Yields one dict per group, label and currency first"""
+        for i, (label, currency) in enumerate(zip(self.labels, self.currencies)):
+            yield {
+                self.by: label,
+                "currency": currency,
+                **{name: self.stats[name][i].item() for name in STAT_COLUMNS},
+            }
+
+
+def analyze(
+    columns: OfferColumns,
+    by: str = "card",
+    in_stock_only: bool = True,
+    condition_factors: dict = CONDITION_FACTORS,
+) -> PriceSummary:
+    """Computes the STAT_COLUMNS of every card, set or scraper, per currency.
+
+    Args:
+        columns (OfferColumns): From ColumnBuilder.build() or load_store()
+        by (str): One of GROUP_BY
+        in_stock_only (bool): Leave out of stock offers out
+        condition_factors (dict): normalize_condition() code -> price relative to near mint
+
+    Returns:
+        PriceSummary: (group, currency) pairs that have at least one offer
+    """
+    _require_numpy()
+    if by not in GROUP_BY:
+        raise ValueError(f"by must be one of {GROUP_BY}, not {by!r}")
+    keep = ~np.isnan(columns.price)
+    if in_stock_only:
+        keep &= columns.in_stock
+    currencies = max(len(columns.labels["currency"]), 1)
+    currency = columns.currency[keep].astype(np.int64)
+    # Every statistic is computed per (group, currency) and (card, currency), so prices
+    # in different currencies never meet
+    card = columns.card[keep] * currencies + currency
+    scraper = columns.scraper[keep]
+    foil = columns.foil[keep]
+    price = columns.price[keep]
+    group = getattr(columns, by)[keep] * currencies + currency
+
+    groups = len(columns.labels[by]) * currencies
+    cards = len(columns.labels["card"]) * currencies
+
+    # Near mint equivalent of every offer
+    factors = np.array(
+        [condition_factors.get(c, 1.0) for c in columns.labels["condition"]] or [1.0]
+    )
+    adjusted = price / factors[columns.condition[keep]]
+
+    offers, mins, medians, maxs = _group_stats(group, price, groups)
+
+    # Medians per (group, finish), code = group * 2 + foil
+    _, _, finish_medians, _ = _group_stats(group * 2 + foil, price, groups * 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        foil_premium = finish_medians[1::2] / finish_medians[0::2] - 1
+
+    regular = ~foil
+    _, _, adjusted_medians, _ = _group_stats(group[regular], adjusted[regular], groups)
+
+    # Every offer against the market of its card, finish and currency
+    _, _, market, _ = _group_stats(card * 2 + foil, adjusted, cards * 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = adjusted / market[card * 2 + foil]
+    _, _, price_index, _ = _group_stats(group, ratio, groups)
+
+    pairs = np.unique(group.astype(np.int64) * len(columns.labels["scraper"]) + scraper)
+    shops = np.bincount(pairs // max(len(columns.labels["scraper"]), 1), minlength=groups)
+
+    present = np.flatnonzero(offers)
+    stats = {
+        "offers": offers,
+        "shops": shops,
+        "min": mins,
+        "median": medians,
+        "max": maxs,
+        "spread": maxs - mins,
+        "foil_premium": foil_premium,
+        "adjusted_median": adjusted_medians,
+        "price_index": price_index,
+    }
+    labels = columns.card_names if by == "card" else columns.labels[by]
+    return PriceSummary(
+        by,
+        [labels[i // currencies] for i in present],
+        [columns.labels["currency"][i % currencies] for i in present],
+        {name: values[present] for name, values in stats.items()},
+    )
+
+
+def sort_summary(summary: PriceSummary, key: str = "offers", reverse: bool = True) -> PriceSummary:
+    """Reorders the groups by a stat column, NaN last"""
+    keys = summary.stats[key].astype(np.float64)
+    order = np.argsort(np.where(np.isnan(keys), -np.inf if reverse else np.inf, keys), kind="stable")
+    if reverse:
+        order = order[::-1]
+    return PriceSummary(
+        summary.by,
+        [summary.labels[i] for i in order],
+        [summary.currencies[i] for i in order],
+        {name: values[order] for name, values in summary.stats.items()},
+    )
+
+
+def _format_stat(name: str, value) -> str:
+    if name in ("offers", "shops"):
+        return f"{int(value)}"
+    if value != value:  # NaN
+        return "-"
+    if name == "foil_premium":
+        return f"{value:+.0%}"
+    if name == "price_index":
+        return f"{value:.2f}"
+    return format_price(float(value))
+
+
+def print_summary(summary: PriceSummary, top: int = 20) -> None:
+    width = max([len(summary.by), *(len(str(label)) for label in summary.labels[:top])])
+    width = min(width, 40)
+    print(
+        f"{summary.by:<{width}} {'cur.':<5}" + "".join(f" {name:>15}" for name in STAT_COLUMNS)
+    )
+    for i, label in enumerate(summary.labels[:top]):
+        print(
+            f"{str(label)[:width]:<{width}} {summary.currencies[i]:<5}"
+            + "".join(
+                f" {_format_stat(name, summary.stats[name][i]):>15}" for name in STAT_COLUMNS
+            )
+        )
+
+
+def write_summary_csv(path: str, summary: PriceSummary) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[summary.by, "currency", *STAT_COLUMNS])
+        writer.writeheader()
+        writer.writerows(summary.rows())
+
+
+def export_columns(path: str, columns: OfferColumns, summary: PriceSummary = None) -> None:
+    """Writes the offer arrays, their labels and the summary to a compressed .npz file.
+
+    Read it back with numpy.load(path), e.g. data["price"][data["card"] == 3].
+    """
+    arrays = {
+        "card": columns.card,
+        "set": columns.set,
+        "scraper": columns.scraper,
+        "condition": columns.condition,
+        "currency": columns.currency,
+        "foil": columns.foil,
+        "in_stock": columns.in_stock,
+        "price": columns.price,
+        "card_labels": np.array(columns.labels["card"], dtype=str),
+        "card_names": np.array(columns.card_names, dtype=str),
+        "set_labels": np.array(columns.labels["set"], dtype=str),
+        "scraper_labels": np.array(columns.labels["scraper"], dtype=str),
+        "condition_labels": np.array(columns.labels["condition"], dtype=str),
+        "currency_labels": np.array(columns.labels["currency"], dtype=str),
+    }
+    if summary is not None:
+        arrays[f"summary_{summary.by}"] = np.array(summary.labels, dtype=str)
+        arrays["summary_currency"] = np.array(summary.currencies, dtype=str)
+        for name, values in summary.stats.items():
+            arrays[f"summary_{name}"] = values
+    np.savez_compressed(path, **arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price statistics across shops")
+    parser.add_argument("input", nargs="?", help="Scrape the cards of this CSV or decklist first, otherwise every stored offer is used")
+    parser.add_argument("--by", choices=GROUP_BY, default="card", help="Group the statistics by")
+    parser.add_argument("--sort", choices=STAT_COLUMNS, default="offers", help="Summary order, highest first")
+    parser.add_argument("--top", type=int, default=20, help="Groups printed")
+    parser.add_argument("--all-offers", action="store_true", help="Count out of stock offers too")
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        help="Only offers scraped less than this many seconds ago, also the reuse age when scraping",
+    )
+    parser.add_argument("--csv", help="Write the whole summary to this CSV file")
+    parser.add_argument("--export", help="Write the offer columns and the summary to this .npz file")
+    parser.add_argument("--all-printings", action="store_true", help="Scrape every printing of a name")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    args = parser.parse_args()
+
+    configure_logging(args.log_level, stream=True)
+    _require_numpy()
+
+    store = OfferStore(os.path.join(get_cache_dir(), "offers.sqlite3"))
+    try:
+        if args.input:
+            # Scraped into the offer store, then read back from it like any other run
+            from bulk import gather_offers
+            from magicmargins import close_async_client, configure_cache, fetch_mm_scrapers_list_async
+
+            configure_cache(get_cache_dir())
+            if args.max_age is not None:
+                store.max_age = args.max_age
+            builder = ColumnBuilder()
+
+            async def gather():
+                try:
+                    scrapers = await fetch_mm_scrapers_list_async()
+                    if not scrapers:
+                        raise RuntimeError("Could not fetch the scraper list")
+                    return await gather_offers(
+                        args.input, builder, scrapers, args.all_printings, store=store
+                    )
+                finally:
+                    await close_async_client()
+
+            print(asyncio.run(gather()))
+            start = time.perf_counter()
+            columns = builder.build()
+        else:
+            start = time.perf_counter()
+            columns = load_store(store, max_age=args.max_age)
+        loaded = time.perf_counter()
+
+        summary = analyze(columns, args.by, in_stock_only=not args.all_offers)
+        summary = sort_summary(summary, args.sort)
+        logger.info(
+            "%d offers loaded in %.2fs, %d groups computed in %.2fs",
+            len(columns),
+            loaded - start,
+            len(summary.labels),
+            time.perf_counter() - loaded,
+        )
+    finally:
+        store.close()
+
+    print_summary(summary, args.top)
+    if args.csv:
+        write_summary_csv(args.csv, summary)
+        print(f"{len(summary.labels)} rows written to {args.csv}")
+    if args.export:
+        export_columns(args.export, columns, summary)
+        print(f"{len(columns)} offers written to {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import logging
+import sys
+import threading
+from collections import deque
+
+LOGGER_NAME = "magicscraper"
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Child logger of the app's root logger, e.g. get_logger("magicmargins").
+
+    Use %-style arguments (logger.debug("Seller: %s", seller)) rather than f-strings,
+    so nothing is formatted when the level is turned off.
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class JsonlFileHandler(logging.Handler):
+    """Writes one JSON object per record, with any `extra=` fields as keys"""
+
+    # Attributes every LogRecord has, anything else came in through `extra=`
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            entry = {
+                "ts": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+            }
+            for key, value in vars(record).items():
+                if key not in self._RESERVED:
+                    entry[key] = value
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            self._file.write(json.dumps(entry, default=str) + "\n")
+            self._file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+class BufferHandler(logging.Handler):
+    """Keeps the last `capacity` formatted lines and forwards new ones to a sink.
+
+    The TUI attaches its RichLog as the sink once it is mounted. Lines logged before
+    that (or while it's detached) are kept in the buffer and replayed on attach.
+    """
+
+    def __init__(self, capacity: int = 500):
+        super().__init__()
+        self.lines = deque(maxlen=capacity)
+        self._sink = None
+        self._sink_thread = None
+        self._call_from_thread = None
+
+    def attach(self, sink, call_from_thread=None) -> None:
+        """Sends lines to sink(line) from now on.
+
+        Args:
+            sink (Callable): e.g. RichLog.write
+            call_from_thread (Callable, optional): e.g. App.call_from_thread, used for
+            records logged from worker threads
+        """
+        self._sink = sink
+        self._sink_thread = threading.get_ident()
+        self._call_from_thread = call_from_thread
+        for line in self.lines:
+            sink(line)
+
+    def detach(self) -> None:
+        self._sink = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)
+            self.lines.append(line)
+            if self._sink is None:
+                return
+            if threading.get_ident() == self._sink_thread:
+                self._sink(line)
+            elif self._call_from_thread is not None:
+                self._call_from_thread(self._sink, line)
+        except Exception:
+            self.handleError(record)
+
+
+def configure_logging(
+    level: str = "INFO",
+    jsonl_path: str = None,
+    buffer_size: int = 0,
+    stream: bool = False,
+) -> BufferHandler:
+    """Sets up the app's logger. Safe to call more than once, handlers are replaced.
+
+    Args:
+        level (str): DEBUG, INFO, WARNING or ERROR
+        jsonl_path (str, optional): Also write every record as JSONL to this file
+        buffer_size (int): Keep this many lines for an in-app log view, 0 for none
+        stream (bool): Also print to stderr, for the headless entry points
+
+    Returns:
+        BufferHandler: The in-app buffer, or None if buffer_size is 0
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper())
+    # Records stay inside the app's handlers, Textual owns the terminal
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    buffer = None
+    if buffer_size:
+        buffer = BufferHandler(buffer_size)
+        buffer.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(buffer)
+    if jsonl_path:
+        logger.addHandler(JsonlFileHandler(jsonl_path))
+    if stream:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    return buffer
@@ -0,0 +1,299 @@
+"""Finds cards a shop buys for more than another shop sells them.
+
+Every shop's offers for a card are split by their `type`: "sell" offers are what the
+shop sells, "buy" offers are its buylist. A card is an opportunity when one shop's buy
+price beats the cheapest in-stock sell price at another shop by at least the margin,
+for the same condition, finish and currency.
+
+Example:
+    python arbitrage.py inventory.csv --margin 0.1 --min-profit 1 -o arbitrage.csv
+
+Example, matching the offers gathered by sharded_bulk.py instead of scraping:
+    python arbitrage.py --queue bulk_queue.sqlite3 --margin 0.1
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from typing import NamedTuple
+
+from app_logging import configure_logging, get_logger
+from bulk import gather_offers
+from magicmargins import close_async_client, configure_cache, fetch_mm_scrapers_async
+from offer_model import format_price, normalize_condition
+from offer_store import DEFAULT_MAX_AGE, OfferStore
+from price_aggregator import is_in_stock, parse_price
+from scraper_health import ScraperHealth
+from utils import get_cache_dir
+
+logger = get_logger("arbitrage")
+
+# Offer "type" values
+SELL = "sell"
+BUY = "buy"
+
+
+class Opportunity(NamedTuple):
+    """Buy a card at `sell_scraper` and sell it to `buy_scraper`'s buylist"""
+
+    card_id: str
+    name: str
+    condition: str
+    foil: bool
+    currency: str
+    sell_scraper: str
+    sell_price: float
+    buy_scraper: str
+    buy_price: float
+    profit: float
+    # profit / sell_price
+    margin: float
+    sell_url: str
+    buy_url: str
+
+
+def _key(card_id: str, offer) -> tuple:
+    return (
+        card_id,
+        normalize_condition(offer.get("condition")),
+        bool(offer.get("foil")),
+        offer.get("currency"),
+    )
+
+
+class ArbitrageIndex:
+    """Keeps only what the matching needs out of a stream of offers.
+
+    Offers are keyed by (card, condition, foil, currency). Each key holds the two
+    cheapest in-stock sell offers from two different shops, so the cheapest one at
+    another shop than any given buyer is always at hand, and the best buy price of every
+    shop. Adding an offer is O(1) and matching is a single pass over the keys, so the
+    memory and time of a run depend on the card count, not on the offer count.
+
+    Args:
+        buylist_shops (set, optional): Only buy offers of these scrapers count, e.g. the
+            ones with the buylist flag from fetch_mm_scrapers()
+        selllist_shops (set, optional): Same for sell offers and the selllist flag
+    """
+
+    def __init__(self, buylist_shops: set = None, selllist_shops: set = None):
+        self.buylist_shops = buylist_shops
+        self.selllist_shops = selllist_shops
+        # key -> [(price, scraper, offer)], at most 2 entries from distinct shops
+        self._sells = {}
+        # key -> {scraper: (price, offer)}
+        self._buys = {}
+        self.offers = 0
+
+    def add(self, card_id: str, offers: list) -> None:
+        """Indexes the offers of one fetch_seller_info() answer"""
+        for offer in offers or []:
+            self.offers += 1
+            price = parse_price(offer.get("price"))
+            if price is None or price <= 0:
+                continue
+            scraper = offer.get("scraperId")
+            kind = offer.get("type")
+            if kind == SELL:
+                if self.selllist_shops is not None and scraper not in self.selllist_shops:
+                    continue
+                if is_in_stock(offer):
+                    self._add_sell(_key(card_id, offer), price, scraper, offer)
+            elif kind == BUY:
+                if self.buylist_shops is not None and scraper not in self.buylist_shops:
+                    continue
+                buys = self._buys.setdefault(_key(card_id, offer), {})
+                if scraper not in buys or price > buys[scraper][0]:
+                    buys[scraper] = (price, offer)
+
+    def _add_sell(self, key: tuple, price: float, scraper: str, offer) -> None:
+        sells = self._sells.setdefault(key, [])
+        for i, (other_price, other_scraper, _) in enumerate(sells):
+            if other_scraper == scraper:
+                if price >= other_price:
+                    return
+                del sells[i]
+                break
+        sells.append((price, scraper, offer))
+        sells.sort(key=lambda entry: entry[0])
+        del sells[2:]
+
+    def opportunities(self, margin: float = 0.0, min_profit: float = 0.0) -> list:
+        """Every (card, seller, buyer) match, most profitable first.
+
+        Args:
+            margin (float): Minimum profit as a fraction of the sell price, 0.1 means the
+                buy price must be at least 10% over it
+            min_profit (float): Minimum profit in the offers' currency
+
+        Returns:
+            list: Opportunity per buying shop that beats the cheapest other seller
+        """
+        found = []
+        for key, buys in self._buys.items():
+            sells = self._sells.get(key)
+            if not sells:
+                continue
+            card_id, condition, foil, currency = key
+            for buy_scraper, (buy_price, buy_offer) in buys.items():
+                # The cheapest seller, or the runner up when that's the buyer itself
+                sell = next((s for s in sells if s[1] != buy_scraper), None)
+                if sell is None:
+                    continue
+                sell_price, sell_scraper, sell_offer = sell
+                profit = round(buy_price - sell_price, 2)
+                if profit <= 0 or profit < min_profit or profit < sell_price * margin:
+                    continue
+                found.append(
+                    Opportunity(
+                        card_id,
+                        sell_offer.get("name") or buy_offer.get("name"),
+                        sell_offer.get("condition"),
+                        foil,
+                        currency,
+                        sell_scraper,
+                        sell_price,
+                        buy_scraper,
+                        buy_price,
+                        profit,
+                        round(profit / sell_price, 4),
+                        sell_offer.get("url"),
+                        buy_offer.get("url"),
+                    )
+                )
+        found.sort(key=lambda o: o.profit, reverse=True)
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "offers": self.offers,
+            "sell_keys": len(self._sells),
+            "buy_keys": len(self._buys),
+        }
+
+
+def index_queue_results(queue_path: str, index: ArbitrageIndex) -> int:
+    """Adds the offers of every done job of a sharded_bulk.py queue, returns the job count"""
+    from job_queue import JobQueue
+
+    queue = JobQueue(queue_path)
+    jobs = 0
+    try:
+        for card_id, _, offers in queue.job_results():
+            index.add(card_id, offers)
+            jobs += 1
+    finally:
+        queue.close()
+    return jobs
+
+
+def write_opportunities(path: str, opportunities: list) -> None:
+    """Writes the matches to a .csv or .jsonl file"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            for opportunity in opportunities:
+                f.write(json.dumps(opportunity._asdict()) + "\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(Opportunity._fields)
+            writer.writerows(opportunities)
+
+
+def print_opportunities(opportunities: list) -> None:
+    for o in opportunities:
+        print(
+            f"{o.name} ({o.condition}{', foil' if o.foil else ''}):"
+            f" buy at {o.sell_scraper} for {format_price(o.sell_price)},"
+            f" sell to {o.buy_scraper} for {format_price(o.buy_price)} {o.currency or ''}"
+            f" -> +{format_price(o.profit)} ({o.margin:.0%})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find buylist prices above another shop's sell price")
+    parser.add_argument("input", nargs="?", help="CSV file with a name column, or a decklist")
+    parser.add_argument("--queue", help="Match the offers of a sharded_bulk.py queue instead of scraping")
+    parser.add_argument("--margin", type=float, default=0.0, help="Minimum profit as a fraction of the sell price")
+    parser.add_argument("--min-profit", type=float, default=0.0, help="Minimum profit in the offers' currency")
+    parser.add_argument("-o", "--output", help="Also write every match to this .csv or .jsonl file")
+    parser.add_argument("--top", type=int, default=20, help="Matches printed, most profitable first")
+    parser.add_argument("--all-printings", action="store_true", help="Scrape every printing of a name")
+    parser.add_argument("--batch-size", type=int, default=20, help="Names resolved and scraped at once")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--per-host-limit", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE,
+        help="Seconds a stored price is reused instead of scraping again, 0 always scrapes",
+    )
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    args = parser.parse_args()
+    if not args.input and not args.queue:
+        parser.error("an input file or --queue is required")
+
+    configure_logging(args.log_level, stream=True)
+    configure_cache(get_cache_dir())
+
+    async def gather():
+        store = OfferStore(
+            os.path.join(get_cache_dir(), "offers.sqlite3"), max_age=args.max_age
+        )
+        try:
+            scrapers = await fetch_mm_scrapers_async()
+            if not scrapers:
+                raise RuntimeError("Could not fetch the scraper list")
+            index = ArbitrageIndex(
+                buylist_shops={s["id"] for s in scrapers if s.get("buylist")},
+                selllist_shops={s["id"] for s in scrapers if s.get("selllist")},
+            )
+            if args.queue:
+                print(f"{index_queue_results(args.queue, index)} jobs read from {args.queue}")
+                return index
+            counters = await gather_offers(
+                args.input,
+                index,
+                [s["id"] for s in scrapers],
+                all_printings=args.all_printings,
+                batch_size=args.batch_size,
+                max_concurrency=args.max_concurrency,
+                per_host_limit=args.per_host_limit,
+                timeout=args.timeout,
+                health=ScraperHealth(
+                    os.path.join(get_cache_dir(), "scraper_health.json"),
+                    max_timeout=args.timeout,
+                ),
+                store=store,
+            )
+            print(counters)
+            return index
+        finally:
+            await close_async_client()
+            store.close()
+
+    try:
+        index = asyncio.run(gather())
+    except KeyboardInterrupt:
+        print("Interrupted, the offers scraped so far are in the offer store")
+        return
+
+    start = time.perf_counter()
+    opportunities = index.opportunities(args.margin, args.min_profit)
+    logger.info(
+        "%d matches out of %s in %.3fs",
+        len(opportunities),
+        index.stats(),
+        time.perf_counter() - start,
+    )
+    print_opportunities(opportunities[: args.top])
+    if args.output:
+        write_opportunities(args.output, opportunities)
+        print(f"{len(opportunities)} matches written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
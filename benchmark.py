@@ -0,0 +1,252 @@
+"""End-to-end benchmarks against the local replay server, no network needed.
+
+Example:
+    python benchmark.py
+    python benchmark.py --config replay.json --bulk-size 1000 --json results.json
+
+Scenarios:
+    single-card   search a card name, then scrape every shop for the first result
+    hover-image   look up and decode the image of a card, like hovering its button
+    bulk          price a generated decklist with bulk.py
+    startup       cold import time of the TUI and of the headless modules, each in a
+                  fresh interpreter, with the heavy modules they pulled in
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import magicmargins
+from replay_server import ReplayConfig, start_replay_server
+
+
+# Modules imported for the cold start scenario. The headless ones must stay usable as a
+# library without the TUI, PIL or requests
+STARTUP_MODULES = ("main", "magicmargins", "bulk", "sharded_bulk", "monitor")
+HEAVY_MODULES = ("textual", "textual_imageview", "PIL", "requests", "rich")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def _reset_clients() -> None:
+    """Every iteration starts cold: no response cache, no pooled connections"""
+    magicmargins.clear_cache()
+    await magicmargins.close_async_client()
+
+
+async def bench_single_card(iterations: int, query: str) -> dict:
+    from shop_events import OFFERS, stream_shop_event_frames
+
+    durations = []
+    first_offer = []
+    for _ in range(iterations):
+        await _reset_clients()
+        start = time.perf_counter()
+        cards = await magicmargins.fetch_search_cards_async(query)
+        scrapers = await magicmargins.fetch_mm_scrapers_list_async()
+        first = None
+        # Same frames the UI renders, so this is when the first offer can be drawn
+        async for frame in stream_shop_event_frames([cards[0]["metadata"]["id"]], scrapers):
+            if first is None and any(event.kind == OFFERS for event in frame):
+                first = time.perf_counter() - start
+        durations.append(time.perf_counter() - start)
+        first_offer.append(first if first is not None else durations[-1])
+    return {
+        "searches_per_s": iterations / sum(durations),
+        "mean_s": sum(durations) / iterations,
+        "time_to_first_offer_s": sum(first_offer) / iterations,
+    }
+
+
+async def bench_hover_image(iterations: int, query: str) -> dict:
+    from image_pipeline import CardImageCache
+
+    cold = []
+    warm = []
+    for _ in range(iterations):
+        await _reset_clients()
+        cards = await magicmargins.fetch_search_cards_async(query)
+        card_id, name = cards[0]["metadata"]["id"], cards[0]["key"]
+        images = CardImageCache()
+
+        start = time.perf_counter()
+        await images.get(card_id, name)
+        cold.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await images.get(card_id, name)
+        warm.append(time.perf_counter() - start)
+    return {
+        "hovers_per_s": iterations / sum(cold),
+        "cold_mean_s": sum(cold) / iterations,
+        "warm_mean_s": sum(warm) / iterations,
+    }
+
+
+async def bench_bulk(size: int) -> dict:
+    from bulk import run_bulk
+
+    await _reset_clients()
+    with tempfile.TemporaryDirectory() as tmp:
+        deck = os.path.join(tmp, "deck.txt")
+        with open(deck, "w", encoding="utf-8") as f:
+            for i in range(size):
+                f.write(f"1 Benchmark Card {i:05d}\n")
+        start = time.perf_counter()
+        counters = await run_bulk(
+            deck, os.path.join(tmp, "out.jsonl"), checkpoint_path=os.path.join(tmp, "cp")
+        )
+        elapsed = time.perf_counter() - start
+    return {
+        "cards_per_s": size / elapsed,
+        "scrapes_per_s": counters["scrapes"] / elapsed,
+        "total_s": elapsed,
+        "rows": counters["rows"],
+    }
+
+
+def bench_startup(iterations: int) -> list:
+    """Best of `iterations` cold imports of every STARTUP_MODULES entry"""
+    results = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in STARTUP_MODULES:
+        times = []
+        for _ in range(iterations):
+            output = subprocess.run(
+                [sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                cwd=here,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            elapsed, heavy = json.loads(output.strip().splitlines()[-1])
+            times.append(elapsed)
+        results.append(
+            {
+                "scenario": f"startup:{module}",
+                "import_s": min(times),
+                "heavy_modules": ",".join(heavy) or "-",
+            }
+        )
+    return results
+
+
+async def run_scenario(name: str, scenario) -> dict:
+    """Runs `scenario()` twice: once for the timings, once under tracemalloc for memory.
+
+    tracemalloc hooks every allocation and slows the code down several times over, so
+    the timings come from the first run and only the peak from the second.
+    """
+    result = await scenario()
+    # Before the traced run, whose bookkeeping would inflate it
+    result["peak_rss_mb"] = _peak_rss_mb()
+    tracemalloc.start()
+    try:
+        await scenario()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result["peak_python_mb"] = peak / (1024 * 1024)
+    return {"scenario": name, **result}
+
+
+def print_results(results: list) -> None:
+    for result in results:
+        print(result["scenario"])
+        for key, value in result.items():
+            if key != "scenario":
+                print(f"    {key:<24} {value:>12.4f}" if isinstance(value, float) else f"    {key:<24} {value:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks against the local replay server")
+    parser.add_argument("--config", help="Replay server config, see replay_server.py")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--bulk-size", type=int, default=1000)
+    parser.add_argument("--query", default="heartfire")
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=("single-card", "hover-image", "bulk", "startup"),
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        help="Exit with an error when a cold import takes longer than this many seconds",
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    scenarios = args.only or ["single-card", "hover-image", "bulk", "startup"]
+    # Measured first, in subprocesses, so the other scenarios don't warm anything up
+    startup = bench_startup(args.iterations) if "startup" in scenarios else []
+
+    config = ReplayConfig.load(args.config) if args.config else ReplayConfig()
+    server = start_replay_server(config)
+    magicmargins.set_client(magicmargins.MagicMarginsClient(base_url=server.base_url))
+    magicmargins.BASE_URL = server.base_url
+
+    async def run():
+        results = []
+        try:
+            if "single-card" in scenarios:
+                results.append(
+                    await run_scenario(
+                        "single-card", lambda: bench_single_card(args.iterations, args.query)
+                    )
+                )
+            if "hover-image" in scenarios:
+                results.append(
+                    await run_scenario(
+                        "hover-image", lambda: bench_hover_image(args.iterations, args.query)
+                    )
+                )
+            if "bulk" in scenarios:
+                results.append(await run_scenario("bulk", lambda: bench_bulk(args.bulk_size)))
+        finally:
+            await magicmargins.close_async_client()
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    results = startup + results
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.startup_budget is not None:
+        slow = [r for r in startup if r["import_s"] > args.startup_budget]
+        for result in slow:
+            print(
+                f"{result['scenario']} took {result['import_s']:.3f}s,"
+                f" over the {args.startup_budget:.3f}s budget"
+            )
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
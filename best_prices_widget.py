@@ -0,0 +1,43 @@
+from textual.widget import Widget
+from rich.panel import Panel
+from rich.table import Table
+
+from offer_model import format_price
+
+
+class BestPricesWidget(Widget):
+    """Cheapest-first table of the in-stock offers found so far"""
+
+    CSS_PATH = "styles.tcss"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.offers = []
+
+    def update_offers(self, offers: list) -> None:
+        self.offers = offers
+        self.refresh(layout=True)
+
+    def render(self) -> Panel:
+        table = Table(expand=True, box=None)
+        table.add_column("Price", style="bold green", no_wrap=True)
+        table.add_column("Shop", style="yellow")
+        table.add_column("Set")
+        table.add_column("Cond.")
+        table.add_column("Foil")
+        table.add_column("Stock", style="bold blue")
+
+        for offer in self.offers:
+            table.add_row(
+                f"{format_price(offer['price'])} {offer.get('currency', '')}",
+                f"{offer.get('scraperId', '')}",
+                f"{offer.get('set_name', '')}",
+                f"{offer.get('condition', '')}",
+                "yes" if offer.get("foil") else "",
+                f"{offer.get('stock', '')}",
+            )
+
+        return Panel(table, title="Lowest prices", expand=True)
+
+    class Meta:
+        css_class = "best-prices-widget"
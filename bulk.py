@@ -0,0 +1,556 @@
+"""Headless bulk pricing for CSV files and decklists.
+
+Example:
+    python bulk.py inventory.csv -o prices.csv --checkpoint prices.checkpoint
+
+Re-running the same command after a crash or Ctrl+C resumes from the checkpoint.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import time
+from itertools import islice
+
+import httpx
+
+from app_logging import configure_logging, get_logger
+from fanout import fan_out_seller_info
+from instrumentation import format_summary, profiler, span
+from offer_model import format_price
+from offer_store import DEFAULT_MAX_AGE, OfferStore
+from price_aggregator import BestPriceAggregator, is_in_stock
+from scraper_health import ScraperHealth
+from search_results import group_search_results
+from magicmargins import (
+    close_async_client,
+    configure_cache,
+    fetch_mm_scrapers_list_async,
+    fetch_search_cards_async,
+    scheduler_stats,
+)
+from utils import get_cache_dir
+
+logger = get_logger("bulk")
+
+# Columns of the output file, offer fields come straight from fetch_seller_info()
+OUTPUT_FIELDS = [
+    "query",
+    "quantity",
+    "card_id",
+    "scraper_id",
+    "id",
+    "type",
+    "name",
+    "set_name",
+    "condition",
+    "foil",
+    "borderless",
+    "price",
+    "currency",
+    "inStock",
+    "stock",
+    "url",
+]
+
+NAME_COLUMNS = ("name", "card", "card_name", "cardname")
+QUANTITY_COLUMNS = ("quantity", "qty", "count")
+
+# "4 Lightning Bolt", "4x Lightning Bolt" or just "Lightning Bolt"
+DECKLIST_LINE = re.compile(r"^(?:(\d+)x?\s+)?(.+?)\s*$", re.IGNORECASE)
+
+
+def read_card_names(path: str):
+    """Streams (card name, quantity) pairs from a CSV file or a plain text decklist.
+
+    CSV files need a header with a name column (name, card, card_name). Decklist lines
+    look like "4 Lightning Bolt", blank lines, "//" comments and "Sideboard" are skipped.
+
+    Args:
+        path (str): .csv file or decklist
+
+    Yields:
+        tuple: (name, quantity)
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            columns = {c.lower().strip(): c for c in reader.fieldnames or []}
+            name_column = next((columns[c] for c in NAME_COLUMNS if c in columns), None)
+            if name_column is None:
+                raise ValueError(f"{path} has no name column, expected one of {NAME_COLUMNS}")
+            qty_column = next(
+                (columns[c] for c in QUANTITY_COLUMNS if c in columns), None
+            )
+            for row in reader:
+                name = (row.get(name_column) or "").strip()
+                if not name:
+                    continue
+                quantity = row.get(qty_column) if qty_column else None
+                yield name, int(quantity) if quantity and quantity.strip().isdigit() else 1
+        else:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith(("//", "#")) or line.lower() == "sideboard":
+                    continue
+                match = DECKLIST_LINE.match(line)
+                yield match.group(2), int(match.group(1) or 1)
+
+
+class Checkpoint:
+    """Append-only JSONL record of the work that has been written to the output.
+
+    Input rows are keyed by their position in the file, so a name listed twice is
+    priced twice and several rows can resolve to the same card. A (card, scraper, row)
+    is recorded once its rows are flushed, a row once all of its pairs are done, so a
+    resumed run only redoes what was in flight. Resuming assumes the input file wasn't
+    edited in between.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = set()
+        self.pairs = set()
+        # Entries of checkpoints written before rows were numbered, keyed by name
+        self.names = set()
+        self.name_pairs = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Half written last line of a crashed run
+                        continue
+                    if "row" in entry:
+                        self.rows.add(entry["row"])
+                    elif "name" in entry:
+                        self.names.add(entry["name"])
+                    elif "pair" in entry:
+                        pair = tuple(entry["pair"])
+                        if len(pair) == 3 and isinstance(pair[2], int):
+                            self.pairs.add(pair)
+                        else:
+                            self.name_pairs.add(pair)
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def has_row(self, row: int, name: str) -> bool:
+        return row in self.rows or name in self.names
+
+    def has_pair(self, card_id: str, scraper_id: str, row: int, name: str) -> bool:
+        return (
+            (card_id, scraper_id, row) in self.pairs
+            or (card_id, scraper_id, name) in self.name_pairs
+            or (card_id, scraper_id) in self.name_pairs
+        )
+
+    def mark_pair(self, card_id: str, scraper_id: str, row: int) -> None:
+        self.pairs.add((card_id, scraper_id, row))
+        self._write({"pair": [card_id, scraper_id, row]})
+
+    def mark_row(self, row: int) -> None:
+        self.rows.add(row)
+        # The pairs of a finished row won't be looked at again
+        self._write({"row": row})
+
+    def _write(self, entry: dict) -> None:
+        if self._file:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+
+
+class OfferWriter:
+    """Writes offer rows to CSV or JSONL as they arrive, appending when resuming"""
+
+    def __init__(self, path: str, fmt: str = None):
+        self.format = fmt or ("jsonl" if path.lower().endswith(".jsonl") else "csv")
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._csv = None
+        if self.format == "csv":
+            self._csv = csv.DictWriter(
+                self._file, fieldnames=OUTPUT_FIELDS, extrasaction="ignore"
+            )
+            if is_new:
+                self._csv.writeheader()
+        self.rows = 0
+
+    def write(self, row: dict) -> None:
+        if self._csv:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + "\n")
+        self.rows += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def resolve_card_ids(name: str, all_printings: bool = False) -> list:
+    """Finds the card UUIDs to price for a name via fetch_search_cards.
+
+    Exact name matches win over fuzzy ones. Without all_printings only the newest
+    printing of the first match is priced.
+
+    Returns:
+        list: Card UUIDs, empty if nothing matches, None if the search failed
+    """
+    try:
+        cards = await fetch_search_cards_async(name)
+    except httpx.HTTPError as e:
+        logger.warning("Search failed for %s: %r", name, e)
+        return None
+    if cards is None:
+        return None
+    groups = group_search_results(cards)
+    if not groups:
+        return []
+    exact = [g for g in groups if g.name.casefold() == name.casefold()] or groups
+    if not all_printings:
+        return exact[0].card_ids[:1]
+    return [card_id for group in exact for card_id in group.card_ids]
+
+
+async def gather_offers(
+    input_path: str,
+    index,
+    scrapers: list,
+    all_printings: bool = False,
+    batch_size: int = 20,
+    max_concurrency: int = 32,
+    per_host_limit: int = 2,
+    timeout: float = 10.0,
+    health: ScraperHealth = None,
+    store: OfferStore = None,
+) -> dict:
+    """Scrapes every card of a CSV/decklist at every shop into an index, not a file.
+
+    `index` is anything with an add(card_id, offers) method, e.g. an
+    arbitrage.ArbitrageIndex or an analytics.ColumnBuilder.
+    """
+    counters = {"names": 0, "unresolved": 0, "scrapes": 0, "stored": 0, "errors": 0}
+    start = time.monotonic()
+    names = read_card_names(input_path)
+    while True:
+        batch = list(islice(names, batch_size))
+        if not batch:
+            return counters
+        resolved = await asyncio.gather(
+            *(resolve_card_ids(name, all_printings) for name, _ in batch)
+        )
+        card_ids = []
+        for (name, _), ids in zip(batch, resolved):
+            if ids is None:
+                counters["errors"] += 1
+                continue
+            if not ids:
+                logger.warning("No card found for %s", name)
+                counters["unresolved"] += 1
+            card_ids.extend(ids)
+
+        async for result in fan_out_seller_info(
+            list(dict.fromkeys(card_ids)),
+            scrapers,
+            max_concurrency=max_concurrency,
+            per_host_limit=per_host_limit,
+            timeout=timeout,
+            health=health,
+            store=store,
+        ):
+            if result.error is not None:
+                counters["errors"] += 1
+                continue
+            index.add(result.card_id, result.seller_info)
+            counters["stored" if result.from_store else "scrapes"] += 1
+
+        if health is not None:
+            health.save()
+        counters["names"] += len(batch)
+        logger.info("%d names gathered, %.1fs", counters["names"], time.monotonic() - start)
+
+
+def print_best_prices(name: str, offers: list) -> None:
+    print(f"{name}: {len(offers)} cheapest in-stock offers")
+    for offer in offers:
+        print(
+            f"    {format_price(offer['price'])} {offer.get('currency', '')} - {offer.get('scraperId', '')}"
+            f" - {offer.get('set_name', '')} - {offer.get('condition', '')}"
+            f"{' - foil' if offer.get('foil') else ''}"
+        )
+
+
+async def run_bulk(
+    input_path: str,
+    output_path: str,
+    checkpoint_path: str = None,
+    output_format: str = None,
+    all_printings: bool = False,
+    in_stock_only: bool = False,
+    batch_size: int = 20,
+    max_concurrency: int = 32,
+    per_host_limit: int = 2,
+    timeout: float = 10.0,
+    best_prices: BestPriceAggregator = None,
+    health: ScraperHealth = None,
+    store: OfferStore = None,
+) -> dict:
+    """Prices every card of a CSV/decklist against every shop.
+
+    Names are handled `batch_size` at a time so memory stays flat regardless of the
+    input size, and rows are flushed as each (card, scraper) scrape finishes.
+
+    When best_prices is given, the cheapest offers of every name are printed as soon
+    as the name is done, then dropped from the aggregator. When health is given, it is
+    used by the fan-out and saved after every batch. When store is given, pairs priced
+    less than store.max_age ago are written from it instead of being scraped again.
+
+    Returns:
+        dict: Counters for the run
+    """
+    scrapers = await fetch_mm_scrapers_list_async()
+    if not scrapers:
+        raise RuntimeError("Could not fetch the scraper list")
+
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = OfferWriter(output_path, output_format)
+    counters = {
+        "names": 0,
+        "skipped": 0,
+        "unresolved": 0,
+        "scrapes": 0,
+        "stored": 0,
+        "errors": 0,
+    }
+    start = time.monotonic()
+
+    rows = (
+        (row, name, quantity)
+        for row, (name, quantity) in enumerate(read_card_names(input_path))
+    )
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            pending = [entry for entry in batch if not checkpoint.has_row(entry[0], entry[1])]
+            counters["skipped"] += len(batch) - len(pending)
+
+            with span("stage.resolve_names", names=len(pending)):
+                resolved = await asyncio.gather(
+                    *(resolve_card_ids(name, all_printings) for _, name, _ in pending)
+                )
+            # card_id -> [(row, query, quantity)], several rows can resolve to one card
+            queries = {}
+            failed = set()
+            for (row, name, quantity), card_ids in zip(pending, resolved):
+                if card_ids is None:
+                    # Not checkpointed, the next run searches it again
+                    counters["errors"] += 1
+                    failed.add(row)
+                    continue
+                if not card_ids:
+                    logger.warning("No card found for %s", name)
+                    counters["unresolved"] += 1
+                    checkpoint.mark_row(row)
+                    continue
+                for card_id in card_ids:
+                    queries.setdefault(card_id, []).append((row, name, quantity))
+
+            # A card with some pairs checkpointed is scraped again, but the results of those
+            # pairs are dropped below since the interrupted run already wrote their rows
+            card_ids = [
+                c
+                for c, entries in queries.items()
+                if any(
+                    not checkpoint.has_pair(c, s, row, name)
+                    for s in scrapers
+                    for row, name, _ in entries
+                )
+            ]
+            async for result in fan_out_seller_info(
+                card_ids,
+                scrapers,
+                max_concurrency=max_concurrency,
+                per_host_limit=per_host_limit,
+                timeout=timeout,
+                health=health,
+                store=store,
+            ):
+                card_queries = [
+                    (row, name, quantity)
+                    for row, name, quantity in queries[result.card_id]
+                    if not checkpoint.has_pair(result.card_id, result.scraper_id, row, name)
+                ]
+                if not card_queries:
+                    continue
+                if result.error is not None:
+                    # Not checkpointed, the next run retries it
+                    counters["errors"] += 1
+                    failed.update(row for row, _, _ in card_queries)
+                    logger.warning(
+                        "%s failed for %s: %r",
+                        result.scraper_id,
+                        card_queries[0][1],
+                        result.error,
+                    )
+                    continue
+
+                if best_prices is not None:
+                    for name in dict.fromkeys(name for _, name, _ in card_queries):
+                        best_prices.add(name, result.seller_info)
+
+                for offer in result.seller_info or []:
+                    if in_stock_only and not is_in_stock(offer):
+                        continue
+                    for _, name, quantity in card_queries:
+                        writer.write(
+                            {
+                                **offer,
+                                "query": name,
+                                "quantity": quantity,
+                                "card_id": result.card_id,
+                                "scraper_id": result.scraper_id,
+                            }
+                        )
+                with span("stage.flush"):
+                    writer.flush()
+                    for row, _, _ in card_queries:
+                        checkpoint.mark_pair(result.card_id, result.scraper_id, row)
+                counters["stored" if result.from_store else "scrapes"] += 1
+
+            done_rows = {
+                row: name for entries in queries.values() for row, name, _ in entries
+            }
+            for row in sorted(done_rows):
+                if row not in failed:
+                    checkpoint.mark_row(row)
+            if best_prices is not None:
+                for name in dict.fromkeys(done_rows[row] for row in sorted(done_rows)):
+                    print_best_prices(name, best_prices.pop(name))
+
+            if health is not None:
+                health.save()
+
+            counters["names"] += len(pending)
+            logger.info(
+                "%d names done, %d rows written, %.1fs",
+                counters["names"] + counters["skipped"],
+                writer.rows,
+                time.monotonic() - start,
+            )
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    counters["rows"] = writer.rows
+    logger.debug("Request scheduler: %s", scheduler_stats())
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price a CSV or decklist against every shop")
+    parser.add_argument("input", help="CSV file with a name column, or a decklist")
+    parser.add_argument("-o", "--output", required=True, help="Output .csv or .jsonl")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the output extension")
+    parser.add_argument("--checkpoint", help="Checkpoint file, defaults to <output>.checkpoint")
+    parser.add_argument("--all-printings", action="store_true", help="Price every printing of a name")
+    parser.add_argument("--in-stock-only", action="store_true", help="Skip out of stock offers")
+    parser.add_argument("--batch-size", type=int, default=20, help="Names resolved and scraped at once")
+    parser.add_argument("--best", type=int, metavar="K", help="Print the K cheapest offers of each name")
+    parser.add_argument("--condition", action="append", help="Only count this condition for --best, repeatable")
+    parser.add_argument("--foil", action=argparse.BooleanOptionalAction, help="Only foils / non foils for --best")
+    parser.add_argument("--borderless", action=argparse.BooleanOptionalAction, help="Only borderless / regular for --best")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--per-host-limit", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE,
+        help="Seconds a stored price is reused instead of scraping again, 0 always scrapes",
+    )
+    parser.add_argument("--no-store", action="store_true", help="Don't read or save the offer store")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--log-file", help="Also write the log as JSONL to this file")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="bulk_trace.jsonl",
+        metavar="TRACE",
+        help="Time every stage, print a summary and append a trace to TRACE",
+    )
+    args = parser.parse_args()
+
+    session = None
+    if args.profile:
+        profiler.enable(args.profile)
+        # asyncio.run() copies this context, so every task of the run records into it
+        session = profiler.begin_search(f"bulk {args.input}")
+
+    configure_logging(args.log_level, jsonl_path=args.log_file, stream=True)
+
+    configure_cache(get_cache_dir())
+
+    best_prices = None
+    if args.best:
+        best_prices = BestPriceAggregator(
+            k=args.best,
+            conditions=set(args.condition) if args.condition else None,
+            foil=args.foil,
+            borderless=args.borderless,
+        )
+
+    store = None
+    if not args.no_store:
+        store = OfferStore(
+            os.path.join(get_cache_dir(), "offers.sqlite3"), max_age=args.max_age
+        )
+
+    async def run():
+        try:
+            return await run_bulk(
+                args.input,
+                args.output,
+                checkpoint_path=args.checkpoint or f"{args.output}.checkpoint",
+                output_format=args.format,
+                all_printings=args.all_printings,
+                in_stock_only=args.in_stock_only,
+                batch_size=args.batch_size,
+                max_concurrency=args.max_concurrency,
+                per_host_limit=args.per_host_limit,
+                timeout=args.timeout,
+                best_prices=best_prices,
+                health=ScraperHealth(
+                    os.path.join(get_cache_dir(), "scraper_health.json"),
+                    max_timeout=args.timeout,
+                ),
+                store=store,
+            )
+        finally:
+            await close_async_client()
+            if store is not None:
+                store.close()
+
+    try:
+        print(asyncio.run(run()))
+    except KeyboardInterrupt:
+        print("Interrupted, run the same command again to resume")
+    finally:
+        rows = profiler.end_search(session)
+        if rows:
+            print(format_summary(rows, session.counters))
+
+
+if __name__ == "__main__":
+    main()
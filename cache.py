@@ -0,0 +1,173 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("cache")
+
+# Seconds a change waits before the file is rewritten, so a burst of responses costs
+# one write instead of one per response
+FLUSH_DELAY = 5.0
+
+
+class TTLCache:
+    """Small LRU cache where every entry expires `ttl` seconds after it was set.
+
+    Optionally backed by a JSON file so a warm restart can skip the round trips.
+    Values must be JSON serializable when a path is given. Changes reach the file
+    FLUSH_DELAY seconds later, written in a thread when an event loop is running, and
+    whatever is left is written by flush() or at exit.
+
+    Args:
+        name (str): Used in stats and as the file name of the on-disk store
+        ttl (float): Seconds an entry stays valid
+        maxsize (int): Max entries kept, the least recently used one is evicted first
+        cache_dir (str, optional): Directory for the on-disk store, memory only if None
+    """
+
+    def __init__(
+        self, name: str, ttl: float, maxsize: int = 256, cache_dir: Optional[str] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expires_at, value), wall clock so it survives restarts
+        self._entries = OrderedDict()
+        self.path = None
+        # Bumped on every change, so an older snapshot never overwrites a newer one
+        self._version = 0
+        self._written_version = 0
+        self._written_at = 0.0
+        self._flush_handle = None
+        self._write_lock = threading.Lock()
+        self._writes = set()
+        if cache_dir is not None:
+            self.attach(cache_dir)
+
+    def attach(self, cache_dir: str) -> None:
+        """Backs the cache with <cache_dir>/<name>.json and loads what's still fresh"""
+        os.makedirs(cache_dir, exist_ok=True)
+        if self.path is None:
+            atexit.register(self.flush)
+        self.path = os.path.join(cache_dir, f"{self.name}.json")
+        self._load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._changed()
+
+    def values(self) -> list:
+        """Values that haven't expired yet, without touching the LRU order or stats"""
+        now = time.time()
+        return [value for expires_at, value in self._entries.values() if expires_at > now]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._changed()
+
+    def flush(self) -> None:
+        """Writes pending changes to the file now, e.g. before the program exits"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.path is not None and self._version != self._written_version:
+            self._write(self._version, dict(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache file %s: %s", self.path, e)
+            return
+
+        now = time.time()
+        # Stored oldest first, so replaying keeps the LRU order
+        for key, (expires_at, value) in stored.items():
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _changed(self) -> None:
+        if self.path is None:
+            return
+        self._version += 1
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Blocking callers write at most every FLUSH_DELAY seconds, the rest at exit
+            if time.monotonic() - self._written_at >= FLUSH_DELAY:
+                self.flush()
+            return
+        self._flush_handle = loop.call_later(FLUSH_DELAY, self._flush_in_thread)
+
+    def _flush_in_thread(self) -> None:
+        self._flush_handle = None
+        # Only the copy happens on the event loop, the encoding and the write don't
+        write = asyncio.ensure_future(
+            asyncio.to_thread(self._write, self._version, dict(self._entries))
+        )
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    def _write(self, version: int, entries: dict) -> None:
+        with self._write_lock:
+            if version <= self._written_version:
+                return
+            # Write then rename so a crash mid-write never leaves a truncated cache
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Could not write cache file %s: %s", self.path, e)
+                return
+            self._written_version = version
+            self._written_at = time.monotonic()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from typing import Callable
+
+from app_logging import get_logger
+from magicmargins import fetch_full_card_details, fetch_full_card_details_async
+
+logger = get_logger("card_details")
+
+# Keep each POST /v1/cards body well under what the API accepts
+MAX_NAMES_PER_REQUEST = 75
+MAX_PAYLOAD_BYTES = 16 * 1024
+
+
+def chunk_card_names(
+    card_names: list,
+    max_names: int = MAX_NAMES_PER_REQUEST,
+    max_bytes: int = MAX_PAYLOAD_BYTES,
+) -> list:
+    """Splits card names into chunks that each fit in one fetch_full_card_details() call.
+
+    Args:
+        card_names (list): Card names, duplicates should already be removed
+        max_names (int): Max names per chunk
+        max_bytes (int): Max JSON encoded size of the names in a chunk
+
+    Returns:
+        list: A list of lists of card names
+    """
+    chunks = []
+    current = []
+    current_bytes = 0
+    for name in card_names:
+        # +2 for the separating ", " in the JSON array
+        name_bytes = len(json.dumps(name)) + 2
+        if current and (len(current) >= max_names or current_bytes + name_bytes > max_bytes):
+            chunks.append(current)
+            current = []
+            current_bytes = 0
+        current.append(name)
+        current_bytes += name_bytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class CardDetailsIndex:
+    """In-memory index of full card details (image URLs, set names, legalities...).
+
+    A whole result page is looked up with as few POSTs as possible, and later lookups by
+    card ID or name are served from memory.
+
+    Args:
+        on_response (Callable, optional): Called with every fetch_full_card_details()
+            response that has cards, e.g. CardNameIndex.add_card_details
+    """
+
+    def __init__(self, on_response: Callable = None):
+        self.on_response = on_response
+        self.by_id = {}
+        self.by_name = {}
+        # Names the API has answered for, even if it returned nothing for them
+        self._loaded = set()
+        # Name -> future of the POST in flight for it, resolved once it's answered,
+        # failed or cancelled
+        self._pending = {}
+
+    def add(self, cards: list) -> None:
+        """Indexes the "cards" list of a fetch_full_card_details() response"""
+        for card in cards:
+            if card.get("id"):
+                self.by_id[card["id"]] = card
+            if card.get("name"):
+                self.by_name.setdefault(card["name"].lower(), card)
+
+    def get(self, card_id: str = None, card_name: str = None) -> dict:
+        """Looks a card up by ID first, then by name. Returns None if it isn't indexed"""
+        card = self.by_id.get(card_id) if card_id else None
+        if card is None and card_name:
+            card = self.by_name.get(card_name.lower())
+        return card
+
+    def image_url(self, card_id: str = None, card_name: str = None) -> str:
+        card = self.get(card_id, card_name)
+        return card.get("image_url") if card else None
+
+    def missing(self, card_names: list) -> list:
+        """Unique names that are neither loaded nor being loaded, in their original order"""
+        missing = []
+        seen = set()
+        for name in card_names:
+            key = name.lower()
+            if key in self._loaded or key in self._pending or key in seen:
+                continue
+            seen.add(key)
+            missing.append(name)
+        return missing
+
+    def load(self, card_names: list) -> None:
+        """Fetches and indexes every name that isn't indexed yet, one POST per chunk"""
+        for chunk in chunk_card_names(self.missing(card_names)):
+            self._add_response(chunk, fetch_full_card_details(chunk))
+
+    async def load_async(self, card_names: list) -> None:
+        """Async version of load(), the chunks are fetched concurrently.
+
+        Names another call is already fetching aren't asked for again, this call waits
+        for that answer instead. If the call is cancelled or fails its names are
+        released, so the next load asks for them again.
+        """
+        waiting = {
+            self._pending[name.lower()]
+            for name in card_names
+            if name.lower() in self._pending
+        }
+        names = self.missing(card_names)
+        loop = asyncio.get_running_loop()
+        owned = {name.lower(): loop.create_future() for name in names}
+        self._pending.update(owned)
+        try:
+            chunks = chunk_card_names(names)
+            responses = await asyncio.gather(
+                *(fetch_full_card_details_async(chunk) for chunk in chunks),
+                return_exceptions=True,
+            )
+            for chunk, response in zip(chunks, responses):
+                if isinstance(response, Exception):
+                    logger.warning("Failed to fetch full card details for %s: %s", chunk, response)
+                    response = None
+                self._add_response(chunk, response)
+        finally:
+            for key, future in owned.items():
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+                future.set_result(None)
+
+        # Shielded, a cancelled waiter must not cancel the other call's future
+        for future in waiting:
+            await asyncio.shield(future)
+
+    def _add_response(self, chunk: list, response: dict) -> None:
+        if not response or not response.get("cards"):
+            # Not marked loaded, the next load asks again
+            return
+        self.add(response["cards"])
+        self._loaded.update(name.lower() for name in chunk)
+        if self.on_response is not None:
+            self.on_response(response)
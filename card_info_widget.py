@@ -2,6 +2,8 @@ from textual.widget import Widget
 from rich.panel import Panel
 from rich.text import Text
 
+from offer_model import format_price
+
 
 class CardInfoWidget(Widget):
     CSS_PATH = "styles.tcss"
@@ -10,7 +12,19 @@ class CardInfoWidget(Widget):
         super().__init__(**kwargs)
         self.card_info = card_info
 
+    def update_card_info(self, card_info: dict) -> None:
+        """Shows another offer, e.g. the row selected in the offers table"""
+        self.card_info = card_info
+        self.refresh(layout=True)
+
     def render(self) -> Panel:
+        if not self.card_info:
+            return Panel(
+                Text("Select an offer to see its details"),
+                title="Card Information",
+                expand=True,
+            )
+
         card_details = Text()
         card_details.append(f"ID: {self.card_info['id']}\n")
         card_details.append(f"Type: {self.card_info['type']}\n")
@@ -19,7 +33,7 @@ class CardInfoWidget(Widget):
         card_details.append(f"Set Name: {self.card_info['set_name']}\n")
         card_details.append(f"URL: {self.card_info['url']}\n")
         card_details.append(
-            f"Price: {self.card_info['price']} {self.card_info['currency']}\n"
+            f"Price: {format_price(self.card_info['price'])} {self.card_info['currency']}\n"
         )
         card_details.append(f"Foil: {self.card_info['foil']}\n")
 
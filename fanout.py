@@ -0,0 +1,137 @@
+import asyncio
+from typing import AsyncIterator, Callable, NamedTuple, Optional
+
+from magicmargins import fetch_seller_info_async
+from offer_store import OfferStore
+from scraper_health import CircuitOpenError, ScraperHealth
+
+
+class ScrapeResult(NamedTuple):
+    """A single (card, scraper) scrape as yielded by fan_out_seller_info()"""
+
+    card_id: str
+    scraper_id: str
+    seller_info: Optional[list]
+    error: Optional[BaseException]
+    elapsed: float
+    # Served from an OfferStore instead of being scraped
+    from_store: bool = False
+
+
+async def fan_out_seller_info(
+    card_ids: list,
+    scrapers: list,
+    fetch: Callable = fetch_seller_info_async,
+    max_concurrency: int = 16,
+    per_host_limit: int = 2,
+    timeout: float = 10.0,
+    health: ScraperHealth = None,
+    store: OfferStore = None,
+    pairs: list = None,
+    on_start: Callable = None,
+) -> AsyncIterator[ScrapeResult]:
+    """Scrapes every (card, scraper) pair at once and yields results in completion order.
+
+    Every scraper is a different shop behind magicmargins, so the per-host limit is keyed
+    by scraper ID. That way one slow shop only ever holds `per_host_limit` slots of the
+    global pool, and the total search time tracks the slowest shop instead of the sum.
+
+    Args:
+        card_ids (list): Card UUIDs taken from fetch_search_cards()
+        scrapers (list): Scraper IDs taken from fetch_mm_scrapers_list()
+        fetch (Callable): Called as fetch(card_id, scraper_id), either a coroutine function
+            or a blocking function (run in a worker thread)
+        max_concurrency (int): Max scrapes in flight overall
+        per_host_limit (int): Max scrapes in flight against a single scraper
+        timeout (float): Seconds before a single scrape is given up on
+        health (ScraperHealth, optional): When given, every scrape is recorded in it, each
+            shop gets its adaptive timeout (capped by `timeout`), failing shops are started
+            last and shops with an open circuit breaker are not scraped at all
+        store (OfferStore, optional): Pairs scraped less than store.max_age ago are
+            yielded from it first without a request, every other pair is scraped and its
+            offers saved to it
+        pairs (list, optional): Scrapes exactly these (card_id, scraper_id) pairs instead
+            of every card at every scraper, e.g. jobs claimed from a JobQueue
+        on_start (Callable, optional): Called as on_start(card_id, scraper_id) when a
+            scrape gets its slots and its request is sent
+
+    Yields:
+        ScrapeResult: One per (card, scraper) pair, as soon as it finishes
+    """
+    if pairs is None:
+        pairs = [(card_id, scraper) for scraper in scrapers for card_id in card_ids]
+    else:
+        card_ids = list(dict.fromkeys(card_id for card_id, _ in pairs))
+        scrapers = list(dict.fromkeys(scraper for _, scraper in pairs))
+
+    global_limit = asyncio.Semaphore(max_concurrency)
+    host_limits = {scraper: asyncio.Semaphore(per_host_limit) for scraper in scrapers}
+    loop = asyncio.get_running_loop()
+    is_async = asyncio.iscoroutinefunction(fetch)
+
+    async def scrape(card_id: str, scraper: str) -> ScrapeResult:
+        async with host_limits[scraper], global_limit:
+            # Checked once the slots are held, not when the task is created, so the
+            # failures and latencies of the scrapes that ran before this one count
+            if health is not None and health.is_open(scraper):
+                error = CircuitOpenError(f"{scraper} is cooling down after repeated failures")
+                return ScrapeResult(card_id, scraper, None, error, 0.0)
+
+            scraper_timeout = timeout
+            if health is not None:
+                scraper_timeout = min(timeout, health.timeout_for(scraper))
+
+            if on_start is not None:
+                on_start(card_id, scraper)
+            start = loop.time()
+            try:
+                if is_async:
+                    call = fetch(card_id, scraper)
+                else:
+                    call = asyncio.to_thread(fetch, card_id, scraper)
+                seller_info = await asyncio.wait_for(call, timeout=scraper_timeout)
+                result = ScrapeResult(card_id, scraper, seller_info, None, loop.time() - start)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = ScrapeResult(card_id, scraper, None, e, loop.time() - start)
+
+            ok = result.error is None and result.seller_info is not None
+            if health is not None:
+                health.record(
+                    scraper,
+                    result.elapsed,
+                    ok,
+                    timed_out=isinstance(result.error, asyncio.TimeoutError),
+                )
+        if store is not None and ok:
+            store.put(card_id, scraper, result.seller_info)
+        return result
+
+    fresh = set()
+    if store is not None:
+        fresh = store.fresh_pairs(card_ids, scrapers) & set(pairs)
+
+    if health is not None:
+        rank = {scraper: i for i, scraper in enumerate(health.order(scrapers))}
+        pairs = sorted(pairs, key=lambda pair: rank[pair[1]])
+
+    # Tasks queue on the semaphores in creation order, so earlier shops go first
+    tasks = [
+        asyncio.create_task(scrape(card_id, scraper))
+        for card_id, scraper in pairs
+        if (card_id, scraper) not in fresh
+    ]
+    try:
+        # Stored pairs are read while the scrapes of the stale ones are already running
+        for card_id, scraper in fresh:
+            offers = store.offers(card_id, scraper)
+            yield ScrapeResult(card_id, scraper, offers, None, 0.0, from_store=True)
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Consumer stopped early or was cancelled, don't leave scrapes running. Async
+        # fetchers abort their request on cancel, blocking ones finish in their thread.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
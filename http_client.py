@@ -0,0 +1,158 @@
+import asyncio
+import random
+from typing import TYPE_CHECKING
+
+import httpx
+
+from instrumentation import count
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_BASE_URL = "https://magicmargins.ca"
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+# Statuses worth retrying, anything else is returned to the caller as-is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class MagicMarginsClient:
+    """Shared blocking HTTP client for magicmargins.
+
+    Wraps a single requests.Session so every call reuses pooled keep-alive connections
+    instead of paying a new TCP+TLS handshake, and retries transient failures with
+    exponential backoff.
+
+    Args:
+        base_url (str): Prepended to relative paths like "/v1/scrapers"
+        timeout (tuple): (connect, read) timeout in seconds used when a call doesn't pass one
+        pool_size (int): Max keep-alive connections kept per host
+        retries (int): Max retries on connection errors and RETRY_STATUSES
+        backoff_factor (float): Sleeps backoff_factor * 2 ** (retry - 1) between retries
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        pool_size: int = 32,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ):
+        # Only the blocking path needs requests, the async fetchers never import it
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            # The cards POST is a read-only lookup, so it's safe to retry as well
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        """Absolute URLs (e.g. scryfall images) pass through, paths get the base URL"""
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{path}"
+
+    def request(self, method: str, path: str, **kwargs) -> "requests.Response":
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, self.url(path), **kwargs)
+        count("http.requests")
+        count("http.bytes", len(response.content))
+        return response
+
+    def get(self, path: str, **kwargs) -> "requests.Response":
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> "requests.Response":
+        return self.request("POST", path, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncMagicMarginsClient:
+    """Async counterpart of MagicMarginsClient built on httpx.AsyncClient.
+
+    Requests run on the event loop itself, so there is no worker thread to block and
+    cancelling the awaiting task aborts the request.
+
+    Args:
+        base_url (str): Prepended to relative paths like "/v1/scrapers"
+        timeout (tuple): (connect, read) timeout in seconds
+        pool_size (int): Max open connections, all of them kept alive between calls
+        retries (int): Max retries on connection errors and RETRY_STATUSES
+        backoff_factor (float): Sleeps backoff_factor * 2 ** (retry - 1) between retries
+        keepalive_expiry (float): Seconds an idle connection is kept open
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        pool_size: int = 32,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        keepalive_expiry: float = 30.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        connect, read = timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            follow_redirects=True,
+        )
+
+    def url(self, path: str) -> str:
+        """Absolute URLs (e.g. scryfall images) pass through, paths get the base URL"""
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{path}"
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        url = self.url(path)
+        for attempt in range(self.retries + 1):
+            last_try = attempt == self.retries
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if last_try:
+                    raise
+            else:
+                count("http.requests")
+                count("http.bytes", len(response.content))
+                if response.status_code not in RETRY_STATUSES or last_try:
+                    return response
+            # Jitter so retries from a fan-out don't all land at the same instant
+            delay = self.backoff_factor * (2**attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,345 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+from app_logging import get_logger
+from card_details import CardDetailsIndex
+from instrumentation import span
+from magicmargins import get_async_client
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = get_logger("image_pipeline")
+
+# Width / height of a scryfall card image
+CARD_ASPECT = 488 / 680
+
+# (columns, rows) assumed when the viewer hasn't been laid out yet
+DEFAULT_VIEWER_CELLS = (40, 28)
+
+
+def fit_image_size(cells: tuple) -> tuple:
+    """Pixel size of a card image filling a viewer of (columns, rows) terminal cells.
+
+    The ImageViewer draws one pixel per column and two per row (half blocks), anything
+    bigger is scaled down again before it is shown.
+    """
+    columns, rows = max(cells[0], 8), max(cells[1], 8)
+    width, height = columns, round(columns / CARD_ASPECT)
+    if height > rows * 2:
+        height = rows * 2
+        width = round(height * CARD_ASPECT)
+    return (width, height)
+
+
+DEFAULT_IMAGE_SIZE = fit_image_size(DEFAULT_VIEWER_CELLS)
+
+
+def decode_card_image(content: bytes, size: tuple) -> "Image.Image":
+    """Decodes and resizes a downloaded card image. CPU bound, run it off the event loop.
+
+    JPEGs are decoded at the smallest of 1/2, 1/4 or 1/8 scale that is still bigger
+    than `size`, so the full resolution image is never held in memory.
+
+    Args:
+        content (bytes): Raw image bytes (scryfall serves JPEG)
+        size (tuple): (width, height) of the returned image
+
+    Returns:
+        Image.Image: Fully loaded RGB image, safe to hand back to the event loop thread
+    """
+    # PIL is only imported once the first image is shown
+    from PIL import Image
+
+    with span("image.decode", bytes=len(content)):
+        image = Image.open(BytesIO(content))
+        # No-op for formats without reduced-scale decoding
+        image.draft("RGB", size)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+        image.load()
+        return image
+
+
+def image_nbytes(image: "Image.Image") -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class ThumbnailCache:
+    """Ready to display card images on disk, keyed by image URL and size.
+
+    Files are named after a hash of (URL, size), so a card shown again, in this session
+    or a later one, is read back without a download or a full-size decode. The oldest
+    files are removed once the directory grows past max_bytes.
+
+    Args:
+        directory (str): Where the PNG files are kept, created if needed
+        max_bytes (int): Disk space the thumbnails may take up
+    """
+
+    # Stores between two checks of the directory size
+    PRUNE_EVERY = 100
+
+    def __init__(self, directory: str, max_bytes: int = 32 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+
+    def path_for(self, url: str, size: tuple) -> str:
+        digest = hashlib.sha256(f"{url}\n{size[0]}x{size[1]}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.png")
+
+    def load(self, url: str, size: tuple) -> "Image.Image":
+        """Returns the stored thumbnail, or None if there is none. Blocking"""
+        from PIL import Image
+
+        path = self.path_for(url, size)
+        try:
+            with Image.open(path) as image:
+                image.load()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except OSError as e:
+            logger.warning("Dropping unreadable thumbnail %s: %s", path, e)
+            self.misses += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self.hits += 1
+        # Bumps the file for prune()
+        os.utime(path)
+        return image
+
+    def save(self, url: str, size: tuple, image: "Image.Image") -> None:
+        """Writes a thumbnail, readers never see a half written file. Blocking"""
+        path = self.path_for(url, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not save thumbnail %s: %s", path, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._stores += 1
+        if self._stores % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> int:
+        """Removes the least recently used files until max_bytes is met, returns how many"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class CardImageCache:
+    """Fetches, decodes and caches card images without blocking the event loop.
+
+    Decoded images are kept in an LRU keyed by (card ID, size) and bounded by their
+    pixel memory. Concurrent requests for the same image (a hover racing a prefetch)
+    share a single download. With a ThumbnailCache, images decoded in earlier sessions
+    are read from disk instead of downloaded.
+
+    Args:
+        details (CardDetailsIndex, optional): Where image URLs are looked up, share it with
+        whatever already loaded the result page so no extra POST is needed
+        max_bytes (int): Upper bound on decoded pixel memory kept in the cache
+        max_prefetch (int): Max images downloaded at once by prefetch()
+        thumbnails (ThumbnailCache, optional): On-disk cache of decoded images
+    """
+
+    def __init__(
+        self,
+        details: CardDetailsIndex = None,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_prefetch: int = 4,
+        thumbnails: ThumbnailCache = None,
+    ):
+        self.details = details if details is not None else CardDetailsIndex()
+        self.thumbnails = thumbnails
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._in_flight = {}
+        # key -> get() calls awaiting its download, prefetches aren't counted
+        self._waiters = {}
+        # prefetch task -> key of the image it loads
+        self._prefetch_tasks = {}
+        self._prefetch_limit = asyncio.Semaphore(max_prefetch)
+
+    def peek(self, card_id: str, size: tuple = DEFAULT_IMAGE_SIZE):
+        """Returns the cached image right away, or None if it isn't decoded yet"""
+        key = (card_id, size)
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+        return image
+
+    async def get(
+        self, card_id: str, card_name: str, size: tuple = DEFAULT_IMAGE_SIZE
+    ) -> "Image.Image":
+        """Returns the decoded image of a card, downloading it if needed.
+
+        Args:
+            card_id (str): Card UUID, used as cache key
+            card_name (str): Card name, used to look up the image URL
+            size (tuple): (width, height) to resize to
+
+        Raises:
+            ValueError: No image URL is known for the card
+            httpx.HTTPError: The image download failed
+        """
+        image = self.peek(card_id, size)
+        if image is not None:
+            return image
+
+        key = (card_id, size)
+        task = self._download(card_id, card_name, size)
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Shielded so moving the mouse away doesn't throw away a half finished download
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def prefetch(self, cards: list, size: tuple = DEFAULT_IMAGE_SIZE) -> None:
+        """Starts downloading images in the background so a later hover is instant.
+
+        Args:
+            cards (list): (card_id, card_name) tuples
+            size (tuple): (width, height) to resize to
+        """
+        for card_id, card_name in cards:
+            if (card_id, size) in self._images:
+                continue
+            task = asyncio.create_task(self._prefetch_one(card_id, card_name, size))
+            self._prefetch_tasks[task] = (card_id, size)
+            task.add_done_callback(lambda t: self._prefetch_tasks.pop(t, None))
+
+    def cancel_prefetch(self) -> None:
+        """Drops pending prefetches, e.g. when a new search replaces the results.
+
+        Downloads a get() call is still waiting for keep going.
+        """
+        for task, key in list(self._prefetch_tasks.items()):
+            task.cancel()
+            download = self._in_flight.get(key)
+            if download is not None and key not in self._waiters:
+                download.cancel()
+                # A get() before the cancellation lands starts a fresh download
+                del self._in_flight[key]
+
+    def stats(self) -> dict:
+        stats = {
+            "images": len(self._images),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+        if self.thumbnails is not None:
+            stats["thumbnails"] = self.thumbnails.stats()
+        return stats
+
+    def _download(self, card_id: str, card_name: str, size: tuple) -> asyncio.Task:
+        """The running download of an image, started if there is none"""
+        self.misses += 1
+        key = (card_id, size)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(card_id, card_name, size))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget_download(key, t))
+        return task
+
+    def _forget_download(self, key: tuple, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def _prefetch_one(self, card_id: str, card_name: str, size: tuple) -> None:
+        async with self._prefetch_limit:
+            try:
+                if self.peek(card_id, size) is None:
+                    await asyncio.shield(self._download(card_id, card_name, size))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Prefetch failed for %s: %s", card_name, e)
+
+    async def _load(self, card_id: str, card_name: str, size: tuple) -> "Image.Image":
+        image_url = self.details.image_url(card_id, card_name)
+        if not image_url:
+            await self.details.load_async([card_name])
+            image_url = self.details.image_url(card_id, card_name)
+        if not image_url:
+            raise ValueError(f"No image_url for {card_name}")
+
+        image = None
+        if self.thumbnails is not None:
+            with span("image.thumbnail"):
+                image = await asyncio.to_thread(self.thumbnails.load, image_url, size)
+        if image is None:
+            with span("image.download"):
+                response = await get_async_client().get(image_url)
+                response.raise_for_status()
+            image = await asyncio.to_thread(
+                self._decode_and_save, image_url, response.content, size
+            )
+        self._store((card_id, size), image)
+        return image
+
+    def _decode_and_save(self, image_url: str, content: bytes, size: tuple) -> "Image.Image":
+        image = decode_card_image(content, size)
+        if self.thumbnails is not None:
+            self.thumbnails.save(image_url, size, image)
+        return image
+
+    def _store(self, key: tuple, image: "Image.Image") -> None:
+        previous = self._images.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= image_nbytes(previous)
+        nbytes = image_nbytes(image)
+        if nbytes > self.max_bytes:
+            return
+        self._images[key] = image
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self.current_bytes -= image_nbytes(evicted)
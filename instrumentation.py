@@ -0,0 +1,199 @@
+"""Timing spans and counters for profiling a search.
+
+Everything is a no-op until enable() is called (main.py / bulk.py --profile), so the
+spans can stay in the hot paths. Each search then collects into its own session:
+
+    session = profiler.begin_search("lookup heartfire")
+    try:
+        ...
+    finally:
+        print(format_summary(profiler.end_search(session), session.counters))
+
+    with span("fetch_seller_info", scraper=scraper_id):
+        ...
+    count("http.bytes", len(response.content))
+"""
+
+import json
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from utils import percentile
+
+# Raw spans kept per search for the trace file, the summary always covers all of them
+MAX_TRACE_SPANS = 50_000
+
+_NOOP = nullcontext()
+
+
+class _Span:
+    __slots__ = ("session", "name", "attrs", "start")
+
+    def __init__(self, session: "ProfileSession", name: str, attrs: dict):
+        self.session = session
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.session._record(self.name, self.start, duration, self.attrs)
+        return False
+
+
+# Session of the search the running code belongs to. Tasks and to_thread() calls copy
+# the context they are started from, so the scrapes and fetches a search starts land
+# in its session even while another search runs next to it
+_current = ContextVar("profile_session", default=None)
+
+
+class ProfileSession:
+    """Spans and counters of one search, from Profiler.begin_search() to end_search()"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.durations = {}
+        self.counters = {}
+        self.spans = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            if not self.closed:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def _record(self, name: str, start: float, duration: float, attrs: dict) -> None:
+        # Spans also finish in worker threads (image decode, blocking fetchers)
+        with self._lock:
+            # Work a search started can outlive it, e.g. image prefetches
+            if self.closed:
+                return
+            self.durations.setdefault(name, []).append(duration)
+            if len(self.spans) < MAX_TRACE_SPANS:
+                self.spans.append(
+                    {
+                        "name": name,
+                        "start": round(start - self._origin, 6),
+                        "duration": round(duration, 6),
+                        **attrs,
+                    }
+                )
+
+    def summary(self) -> list:
+        """count/total/mean/p50/p95/max per span name, by total time spent"""
+        rows = []
+        for name, durations in self.durations.items():
+            total = sum(durations)
+            rows.append(
+                {
+                    "stage": name,
+                    "count": len(durations),
+                    "total": round(total, 6),
+                    "mean": round(total / len(durations), 6),
+                    "p50": round(percentile(durations, 0.5), 6),
+                    "p95": round(percentile(durations, 0.95), 6),
+                    "max": round(max(durations), 6),
+                }
+            )
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows
+
+
+class Profiler:
+    """Hands out a ProfileSession per search and writes a trace entry per session.
+
+    Spans and counters go to the session of the code running them, code outside any
+    search isn't recorded.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self._lock = threading.Lock()
+
+    def enable(self, trace_path: str = None) -> None:
+        """Starts collecting. Each finished search is appended to trace_path as JSONL"""
+        self.enabled = True
+        self.trace_path = trace_path
+
+    def span(self, name: str, **attrs):
+        session = _current.get() if self.enabled else None
+        if session is None:
+            return _NOOP
+        return _Span(session, name, attrs)
+
+    def count(self, name: str, n: int = 1) -> None:
+        session = _current.get() if self.enabled else None
+        if session is not None:
+            session.count(name, n)
+
+    def begin_search(self, label: str) -> ProfileSession:
+        """Starts a session for the calling task and whatever it starts from now on.
+
+        Returns:
+            ProfileSession: To pass to end_search(), None when profiling is off
+        """
+        if not self.enabled:
+            return None
+        session = ProfileSession(label)
+        _current.set(session)
+        return session
+
+    def end_search(self, session: ProfileSession) -> list:
+        """Closes the session, writes it to the trace file and returns its summary rows"""
+        if session is None:
+            return []
+        with session._lock:
+            session.closed = True
+        rows = session.summary()
+        entry = {
+            "search": session.label,
+            "started_at": session.started_at,
+            "wall": round(time.perf_counter() - session._origin, 6),
+            "summary": rows,
+            "counters": dict(session.counters),
+            "spans": list(session.spans),
+        }
+        if self.trace_path:
+            # Sessions of concurrent searches end from different tasks and threads
+            with self._lock, open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        return rows
+
+
+def format_summary(rows: list, counters: dict = None) -> str:
+    """Plain text table of summary rows, readable in the RichLog and a terminal"""
+    lines = [
+        f"{'stage':<32} {'count':>6} {'total':>9} {'mean':>9} {'p95':>9} {'max':>9}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['stage']:<32} {row['count']:>6} {row['total']:>8.3f}s"
+            f" {row['mean']:>8.3f}s {row['p95']:>8.3f}s {row['max']:>8.3f}s"
+        )
+    for name, value in sorted((counters or {}).items()):
+        lines.append(f"{name:<32} {value:>6}")
+    return "\n".join(lines)
+
+
+profiler = Profiler()
+
+
+def span(name: str, **attrs):
+    """Times the enclosed block under `name` when profiling is on"""
+    return profiler.span(name, **attrs)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Adds n to a counter when profiling is on"""
+    profiler.count(name, n)
@@ -0,0 +1,263 @@
+import os
+import socket
+import sqlite3
+import time
+
+from offer_model import decode_offers, dumps
+
+# A claimed job not finished within this many seconds goes back to the queue, so the
+# jobs of a crashed or killed worker are picked up by the others
+DEFAULT_LEASE = 120.0
+# A failed job waits this many seconds before it can be claimed again, doubled on
+# every further attempt, so a shop that is down isn't hammered by the retries
+DEFAULT_RETRY_DELAY = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    card_id TEXT NOT NULL,
+    scraper_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    retry_after REAL,
+    error TEXT,
+    offers TEXT,
+    finished_at REAL,
+    PRIMARY KEY (card_id, scraper_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS inputs (
+    row INTEGER NOT NULL,
+    card_id TEXT NOT NULL,
+    query TEXT,
+    quantity INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (row, card_id)
+);
+"""
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Durable (card, scraper) job queue in a SQLite file shared by every worker.
+
+    A job is a single fetch_seller_info() call. Every input row is recorded with the
+    cards it resolved to, while jobs are kept once per (card, scraper) pair: a card
+    listed twice is scraped once and exported once per row, and enqueuing the same
+    rows again on a rerun adds nothing.
+    Workers claim jobs under a lease and report them done or failed, failed jobs go
+    back to the queue with an exponential backoff until they run out of attempts.
+
+    Workers on other machines can share the file over a network filesystem, in which
+    case pass wal=False since WAL needs shared memory on a single host.
+
+    Args:
+        path (str): SQLite file of the queue
+        lease (float): Seconds a claim is valid
+        max_attempts (int): Tries before a job is marked failed for good
+        retry_delay (float): Seconds before the first retry of a failed job
+        wal (bool): Use WAL journaling, faster with many local workers
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease: float = DEFAULT_LEASE,
+        max_attempts: int = 3,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        wal: bool = True,
+    ):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        if wal:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "retry_after" not in columns:
+            # Queue files created before retries were delayed
+            self._db.execute("ALTER TABLE jobs ADD COLUMN retry_after REAL")
+        if "query" in columns:
+            # Queue files created before input rows were kept apart held one query
+            # per card on its jobs. Negative rows can't clash with real ones
+            self._db.execute(
+                "INSERT OR IGNORE INTO inputs (row, card_id, query, quantity)"
+                " SELECT -MIN(rowid), card_id, query, quantity FROM jobs GROUP BY card_id"
+            )
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't both
+        # read the same pending rows and claim them
+        return _Transaction(self._db)
+
+    def enqueue(self, rows: list, scrapers: list) -> int:
+        """Records (row, card_id, query, quantity) input rows and queues a job for each
+        of their cards at every scraper.
+
+        `row` is the position of the name in the input file, several rows can share a
+        card and one row can resolve to several cards.
+
+        Returns:
+            int: Jobs that weren't queued yet
+        """
+        with self._transaction():
+            self._db.executemany(
+                "INSERT OR IGNORE INTO inputs (row, card_id, query, quantity)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO jobs (card_id, scraper_id) VALUES (?, ?)",
+                [
+                    (card_id, scraper)
+                    for card_id in dict.fromkeys(card_id for _, card_id, _, _ in rows)
+                    for scraper in scrapers
+                ],
+            )
+            return self._db.total_changes - before
+
+    def claim(self, worker: str, limit: int = 50) -> list:
+        """Claims up to `limit` pending or expired jobs, as (card_id, scraper_id) pairs.
+
+        Failed jobs waiting for their retry delay are left alone.
+        """
+        now = time.time()
+        with self._transaction():
+            rows = self._db.execute(
+                "SELECT card_id, scraper_id FROM jobs"
+                " WHERE (status = 'pending' AND (retry_after IS NULL OR retry_after <= ?))"
+                " OR (status = 'claimed' AND lease_expires < ?)"
+                " LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET status = 'claimed', worker = ?, lease_expires = ?,"
+                " attempts = attempts + 1 WHERE card_id = ? AND scraper_id = ?",
+                [(worker, now + self.lease, card_id, scraper) for card_id, scraper in rows],
+            )
+        return rows
+
+    def complete(self, results: list) -> None:
+        """Records (card_id, scraper_id, offers) of finished jobs in one transaction"""
+        now = time.time()
+        with self._transaction():
+            self._db.executemany(
+                "UPDATE jobs SET status = 'done', offers = ?, error = NULL,"
+                " finished_at = ? WHERE card_id = ? AND scraper_id = ?",
+                [
+                    (dumps(offers), now, card_id, scraper)
+                    for card_id, scraper, offers in results
+                ],
+            )
+
+    def fail(self, failures: list) -> int:
+        """Records (card_id, scraper_id, error) of failed jobs, retried while attempts last.
+
+        Returns:
+            int: Jobs that ran out of attempts and are now failed for good
+        """
+        now = time.time()
+        updates = []
+        given_up = 0
+        with self._transaction():
+            for card_id, scraper, error in failures:
+                row = self._db.execute(
+                    "SELECT attempts FROM jobs WHERE card_id = ? AND scraper_id = ?",
+                    (card_id, scraper),
+                ).fetchone()
+                attempts = row[0] if row else 0
+                if attempts >= self.max_attempts:
+                    status, retry_after = "failed", None
+                    given_up += 1
+                else:
+                    status = "pending"
+                    retry_after = now + self.retry_delay * 2 ** max(attempts - 1, 0)
+                updates.append((status, error, retry_after, card_id, scraper))
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, error = ?, retry_after = ?,"
+                " lease_expires = NULL WHERE card_id = ? AND scraper_id = ?",
+                updates,
+            )
+        return given_up
+
+    def defer(self, jobs: list, delay: float) -> None:
+        """Puts claimed (card_id, scraper_id) jobs back without using up an attempt.
+
+        For jobs that weren't tried at all, e.g. because their shop's circuit breaker
+        is open, they can be claimed again after `delay` seconds.
+        """
+        with self._transaction():
+            self._db.executemany(
+                "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0),"
+                " retry_after = ?, lease_expires = NULL"
+                " WHERE card_id = ? AND scraper_id = ?",
+                [(time.time() + delay, card_id, scraper) for card_id, scraper in jobs],
+            )
+
+    def retry_failed(self) -> int:
+        """Puts the jobs that ran out of attempts back in the queue"""
+        with self._transaction():
+            return self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, retry_after = NULL"
+                " WHERE status = 'failed'"
+            ).rowcount
+
+    def progress(self) -> dict:
+        """Job count per status, with expired claims counted as pending"""
+        counts = {"pending": 0, "claimed": 0, "done": 0, "failed": 0}
+        rows = self._db.execute(
+            "SELECT CASE WHEN status = 'claimed' AND lease_expires < ? THEN 'pending'"
+            " ELSE status END, COUNT(*) FROM jobs GROUP BY 1",
+            (time.time(),),
+        )
+        counts.update(dict(rows))
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def is_finished(self) -> bool:
+        progress = self.progress()
+        return progress["pending"] == 0 and progress["claimed"] == 0
+
+    def results(self):
+        """Streams (card_id, scraper_id, query, quantity, offers) of every done job, once
+        per input row of its card, in input order"""
+        cursor = self._db.execute(
+            "SELECT inputs.card_id, jobs.scraper_id, inputs.query, inputs.quantity,"
+            " jobs.offers FROM inputs JOIN jobs ON jobs.card_id = inputs.card_id"
+            " WHERE jobs.status = 'done'"
+            " ORDER BY inputs.row, inputs.card_id, jobs.scraper_id"
+        )
+        for card_id, scraper, query, quantity, offers in cursor:
+            yield card_id, scraper, query, quantity, decode_offers(offers)
+
+    def job_results(self):
+        """Streams (card_id, scraper_id, offers) of every done job, once per job"""
+        cursor = self._db.execute(
+            "SELECT card_id, scraper_id, offers FROM jobs WHERE status = 'done'"
+        )
+        for card_id, scraper, offers in cursor:
+            yield card_id, scraper, decode_offers(offers)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class _Transaction:
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
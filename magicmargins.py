@@ -1,9 +1,158 @@
-import requests
+import asyncio
 import json
-import utils
+import os
+from app_logging import get_logger
+from cache import TTLCache
+from instrumentation import count, span
+from http_client import AsyncMagicMarginsClient, MagicMarginsClient
+from offer_model import decode_offers, loads
+from request_scheduler import RequestScheduler
 
 # https://magicmargins.ca/v1/cards?search=heartfire&sparse=true
 
+logger = get_logger("magicmargins")
+
+BASE_URL = os.environ.get("MAGICMARGINS_BASE_URL", "https://magicmargins.ca")
+
+# Shared clients, created on first use. Swap them with set_client()/set_async_client()
+_client = None
+_async_client = None
+_scheduler = None
+
+
+# Per-endpoint cache lifetimes in seconds, the shop list almost never changes
+CACHE_TTLS = {
+    "scrapers": 24 * 60 * 60,
+    "search": 60 * 60,
+    "card_details": 6 * 60 * 60,
+}
+CACHE_SIZES = {"scrapers": 2, "search": 256, "card_details": 1024}
+
+# (requests per second, burst) of the async fetchers, "scrape" applies to each scraper
+RATE_LIMITS = {
+    "search": (10, 20),
+    "card_details": (5, 10),
+    "scrapers": (1, 2),
+    "card": (10, 20),
+    "scrape": (10, 10),
+}
+
+_caches = {
+    name: TTLCache(name, ttl, maxsize=CACHE_SIZES[name])
+    for name, ttl in CACHE_TTLS.items()
+}
+
+
+def configure_cache(cache_dir: str = None, ttls: dict = None) -> None:
+    """Adjusts the response caches.
+
+    Args:
+        cache_dir (str, optional): Backs every cache with a JSON file in this directory,
+        e.g. utils.get_cache_dir(), so a warm restart skips the round trips
+        ttls (dict, optional): Overrides CACHE_TTLS per endpoint, 0 disables that cache
+    """
+    for name, ttl in (ttls or {}).items():
+        _caches[name].ttl = ttl
+    if cache_dir is not None:
+        for cache in _caches.values():
+            cache.attach(cache_dir)
+
+
+def cache_stats() -> dict:
+    """Hit and miss counts for every response cache, keyed by endpoint"""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def cached_card_names() -> list:
+    """Card names found in the cached search and full-details responses"""
+    names = []
+    for cards in _caches["search"].values():
+        names.extend(card["key"] for card in cards or [] if card.get("key"))
+    for response in _caches["card_details"].values():
+        cards = (response or {}).get("cards") or []
+        names.extend(card["name"] for card in cards if card.get("name"))
+    return names
+
+
+def clear_cache() -> None:
+    for cache in _caches.values():
+        cache.clear()
+
+
+def _details_cache_key(card_names: list) -> str:
+    # Order is kept in the key since the response list follows the request order
+    return "\n".join(card_names)
+
+
+def get_client() -> MagicMarginsClient:
+    """Returns the shared pooled client used by every blocking fetch_* function"""
+    global _client
+    if _client is None:
+        _client = MagicMarginsClient(base_url=BASE_URL)
+    return _client
+
+
+def set_client(client: MagicMarginsClient) -> None:
+    """Injects the client used by the blocking fetch_* functions (e.g. other timeouts)"""
+    global _client
+    _client = client
+
+
+def get_async_client() -> AsyncMagicMarginsClient:
+    """Returns the shared pooled client used by every fetch_*_async function.
+
+    Must be called from inside the running event loop the client will be used on.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMagicMarginsClient(base_url=BASE_URL)
+    return _async_client
+
+
+def set_async_client(client: AsyncMagicMarginsClient) -> None:
+    """Injects the client used by the fetch_*_async functions"""
+    global _async_client
+    _async_client = client
+
+
+def get_scheduler() -> RequestScheduler:
+    """Returns the rate limiter and single-flight layer every fetch_*_async goes through.
+
+    Tied to the event loop like the async client, and reset with it.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler(RATE_LIMITS)
+    return _scheduler
+
+
+def set_scheduler(scheduler: RequestScheduler) -> None:
+    """Injects the scheduler used by the fetch_*_async functions (e.g. other limits)"""
+    global _scheduler
+    _scheduler = scheduler
+
+
+def scheduler_stats() -> list:
+    """Queue depth, wait times and coalesced calls per rate limit bucket"""
+    return _scheduler.stats() if _scheduler is not None else []
+
+
+async def close_async_client() -> None:
+    """Closes the shared async client and writes the cache files, call before its event
+    loop shuts down"""
+    global _async_client, _scheduler
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    _scheduler = None
+    await asyncio.to_thread(flush_caches)
+
+
+def flush_caches() -> None:
+    """Writes the pending changes of every file-backed cache"""
+    for cache in _caches.values():
+        cache.flush()
+
 
 def fetch_search_cards(search: str) -> dict:
     """
@@ -17,17 +166,48 @@ def fetch_search_cards(search: str) -> dict:
         dict: A dict of cards with their details.
     """
 
-    url = f"https://magicmargins.ca/v1/cards?search={search}&sparse=false"
-    response = requests.get(url)
+    cached = _caches["search"].get(search)
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    with span("fetch_search_cards", search=search):
+        response = get_client().get("/v1/cards", params=_search_params(search))
+        return _parse_search_cards(response, search)
+
+
+async def fetch_search_cards_async(search: str) -> dict:
+    """Async version of fetch_search_cards()"""
+    cached = _caches["search"].get(search)
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    async def request():
+        with span("fetch_search_cards", search=search):
+            response = await get_async_client().get(
+                "/v1/cards", params=_search_params(search)
+            )
+            return _parse_search_cards(response, search)
+
+    return await get_scheduler().call("search", ("search", search), request)
+
+
+def _search_params(search: str) -> dict:
+    return {"search": search, "sparse": "false"}
+
+
+def _parse_search_cards(response, search: str) -> dict:
     if response.status_code == 200:
         try:
-            res = response.json()
+            res = loads(response.content)
+            _caches["search"].set(search, res["cards"])
             return res["cards"]
-        except requests.exceptions.JSONDecodeError:
-            print(f"No JSON content returned for {search}")
+        except json.JSONDecodeError:
+            logger.warning("No JSON content returned for %s", search)
             return None
     else:
-        print(f"Failed to fetch data for {search}: {response.status_code}")
+        logger.warning("Failed to fetch data for %s: %s", search, response.status_code)
         return None
 
 
@@ -41,19 +221,49 @@ def fetch_full_card_details(card_names: list) -> list:
     Returns:
         list: A list of dicts containing the full metadata for each card.
     """
-    url = "https://magicmargins.ca/v1/cards"
+    cached = _caches["card_details"].get(_details_cache_key(card_names))
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    payload = {"cardNames": card_names, "unique": True}
+    with span("fetch_full_card_details", names=len(card_names)):
+        response = get_client().post("/v1/cards", json=payload)
+        return _parse_full_card_details(response, card_names)
+
+
+async def fetch_full_card_details_async(card_names: list) -> list:
+    """Async version of fetch_full_card_details()"""
+    cached = _caches["card_details"].get(_details_cache_key(card_names))
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
     payload = {"cardNames": card_names, "unique": True}
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=payload, headers=headers)
+
+    async def request():
+        with span("fetch_full_card_details", names=len(card_names)):
+            response = await get_async_client().post("/v1/cards", json=payload)
+            return _parse_full_card_details(response, card_names)
+
+    key = ("card_details", _details_cache_key(card_names))
+    return await get_scheduler().call("card_details", key, request)
+
+
+def _parse_full_card_details(response, card_names: list) -> list:
     if response.status_code == 200:
         try:
-            return response.json()
-        except requests.exceptions.JSONDecodeError:
-            print(f"No JSON content returned for {card_names}")
+            result = loads(response.content)
+            _caches["card_details"].set(_details_cache_key(card_names), result)
+            return result
+        except json.JSONDecodeError:
+            logger.warning("No JSON content returned for %s", card_names)
             return None
     else:
-        print(
-            f"Failed to fetch full card details for {card_names}: {response.status_code}"
+        logger.warning(
+            "Failed to fetch full card details for %s: %s",
+            card_names,
+            response.status_code,
         )
         return None
 
@@ -68,6 +278,9 @@ def display_search_cards(searchList: dict) -> None:
     Returns:
         None
     """
+    # Only this console helper needs the print utilities
+    import utils
+
     # The dict keys
     name = "key"
     date = "released_at"
@@ -102,14 +315,27 @@ def fetch_specific_card(search_uuid: str) -> dict:
     Returns:
         dict: Specific card data
     """
-    url = f"https://magicmargins.ca/v1/cards/{search_uuid}"
-    response = requests.get(url)
+    with span("fetch_specific_card"):
+        response = get_client().get(f"/v1/cards/{search_uuid}")
+        return _parse_specific_card(response)
+
 
+async def fetch_specific_card_async(search_uuid: str) -> dict:
+    """Async version of fetch_specific_card()"""
+    async def request():
+        with span("fetch_specific_card"):
+            response = await get_async_client().get(f"/v1/cards/{search_uuid}")
+            return _parse_specific_card(response)
+
+    return await get_scheduler().call("card", ("card", search_uuid), request)
+
+
+def _parse_specific_card(response) -> dict:
     if response.status_code == 200:
         try:
-            return response.json()
+            return loads(response.content)
         except:
-            print(f"Error: {response.text}")
+            logger.warning("Error: %s", response.text)
             return None
 
 
@@ -121,33 +347,89 @@ def fetch_mm_scrapers_list() -> list:
     Returns:
         Example: ['facetofacegames', 'kanatacg', '401games', 'fusiongamingonline', 'kesselrungames', 'gamezilla', 'comichunter', 'multizone', 'cartamagica', 'cardshoptolaria', 'vortexgames', 'magicstronghold', 'everythinggames', 'gauntletgamesvictoria', 'gameknight', 'allaboardgames']
     """
-    url = f"https://magicmargins.ca/v1/scrapers"
-    response = requests.get(url)
+    cached = _caches["scrapers"].get("scrapers")
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    with span("fetch_mm_scrapers_list"):
+        response = get_client().get("/v1/scrapers")
+        return _parse_scrapers_list(response)
+
+
+async def fetch_mm_scrapers_list_async() -> list:
+    """Async version of fetch_mm_scrapers_list()"""
+    cached = _caches["scrapers"].get("scrapers")
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    async def request():
+        with span("fetch_mm_scrapers_list"):
+            response = await get_async_client().get("/v1/scrapers")
+            return _parse_scrapers_list(response)
+
+    return await get_scheduler().call("scrapers", ("scrapers",), request)
+
+
+def fetch_mm_scrapers() -> list:
+    """Gets the full scraper entries, with the buylist/selllist flags and shop URL: \n
+    {'id': 'facetofacegames', 'url': 'https://www.facetofacegames.com', 'buylist': True, 'selllist': True}
+
+    Returns:
+        list: One dict per scraper, None if the request failed
+    """
+    cached = _caches["scrapers"].get("scraper_details")
+    if cached is not None:
+        count("cache.hits")
+        return cached
+
+    with span("fetch_mm_scrapers_list"):
+        response = get_client().get("/v1/scrapers")
+        return _parse_scrapers(response)
+
+
+async def fetch_mm_scrapers_async() -> list:
+    """Async version of fetch_mm_scrapers()"""
+    cached = _caches["scrapers"].get("scraper_details")
+    if cached is not None:
+        count("cache.hits")
+        return cached
 
-    result_arr = []
+    async def request():
+        with span("fetch_mm_scrapers_list"):
+            response = await get_async_client().get("/v1/scrapers")
+            return _parse_scrapers(response)
 
+    return await get_scheduler().call("scrapers", ("scraper_details",), request)
+
+
+def _parse_scrapers_list(response) -> list:
+    scrapers = _parse_scrapers(response)
+    return [item["id"] for item in scrapers] if scrapers is not None else None
+
+
+def _parse_scrapers(response) -> list:
     if response.status_code == 200:
         try:
-            result = response.json()
-            # print(result)
+            result = loads(response.content)
             if result is not None:
-                for item in result:
-                    result_arr.append(item["id"])
-
-                # print(result_arr)
-                return result_arr
+                # Both forms are cached, most callers only need the IDs
+                _caches["scrapers"].set("scraper_details", result)
+                _caches["scrapers"].set("scrapers", [item["id"] for item in result])
+                return result
             else:
-                print("Error: No JSON Concent Returned")
+                logger.warning("Error: No JSON Concent Returned")
                 return None
-        except requests.exceptions.JSONDecodeError:
-            print(f"Error: {response.text}")
+        except json.JSONDecodeError:
+            logger.warning("Error: %s", response.text)
             return None
     else:
-        print(f"Failed to fetch data:  {response.status_code}")
+        logger.warning("Failed to fetch data:  %s", response.status_code)
         return None
 
 
-def fetch_seller_info(cardID: str, scraperID: str) -> json:
+def fetch_seller_info(cardID: str, scraperID: str) -> list:
     """Gets seller info list, if it's in-stock, price etc.
 
     Args:
@@ -156,18 +438,38 @@ def fetch_seller_info(cardID: str, scraperID: str) -> json:
         {'id': 'facetofacegames', 'url': 'https://www.facetofacegames.com', 'buylist': True, 'selllist': True}
 
     Returns:
-        _type_: _description_
+        list: offer_model.Offer per offer, they also read like the API's dicts
     """
 
-    url = f"https://magicmargins.ca/v1/scrapers/{scraperID}/scrape/{cardID}?ignore_sets=true"
-    response = requests.get(url)
+    with span("fetch_seller_info", scraper=scraperID):
+        response = get_client().get(_seller_info_path(cardID, scraperID))
+        return _parse_seller_info(response)
+
+
+async def fetch_seller_info_async(cardID: str, scraperID: str) -> list:
+    """Async version of fetch_seller_info()"""
+    async def request():
+        with span("fetch_seller_info", scraper=scraperID):
+            response = await get_async_client().get(_seller_info_path(cardID, scraperID))
+            return _parse_seller_info(response)
+
+    # Two searches scraping the same pair at once share a single request
+    key = ("seller_info", cardID, scraperID)
+    return await get_scheduler().call(f"scrape:{scraperID}", key, request)
+
+
+def _seller_info_path(cardID: str, scraperID: str) -> str:
+    return f"/v1/scrapers/{scraperID}/scrape/{cardID}?ignore_sets=true"
+
 
+def _parse_seller_info(response) -> list:
     if response.status_code == 200:
         try:
-            return response.json()
+            # Decoded once into compact Offer records, price and stock already numbers
+            return decode_offers(response.content)
 
         except:
-            print(f"Error: {response.text}")
+            logger.warning("Error: %s", response.text)
             return None
 
 
@@ -207,8 +509,9 @@ def main():
         x = get_card_uuid(i)
         arr_cards_id.append(x)
 
+    scrapers = fetch_mm_scrapers_list()
     for card_id in arr_cards_id:
-        for scraper in fetch_mm_scrapers_list():
+        for scraper in scrapers:
             seller_info = fetch_seller_info(card_id, scraper)
             # print(seller_info[0])
             if seller_info and int(seller_info[0]["stock"]) > 0:
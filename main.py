@@ -1,26 +1,81 @@
+import argparse
 import asyncio
-from rich.console import Console
+import os
 from typing import Coroutine
 from textual.app import App, ComposeResult
-from textual.events import Key, MouseMove, Enter, Leave
-from textual.widgets import Static, Button, Header, Label, RichLog, Input, Pretty
-from textual.containers import Horizontal, Vertical, VerticalScroll
+from textual.events import Key, Enter, Leave
+from textual.widgets import (
+    Static,
+    Button,
+    Header,
+    Label,
+    RichLog,
+    Input,
+    DataTable,
+    OptionList,
+    ProgressBar,
+)
+from textual.containers import Horizontal, Vertical
 from textual.css.query import NoMatches  # Import NoMatches exceptio
-from textual_imageview.viewer import ImageViewer
-from PIL import Image
-from utils import print_hash
-import requests
-from io import BytesIO
+from utils import get_cache_dir
+from app_logging import BufferHandler, configure_logging, get_logger
+from instrumentation import count, format_summary, profiler, span
 from magicmargins import (
-    fetch_search_cards,
+    fetch_search_cards_async,
     get_card_uuid,
-    fetch_mm_scrapers_list,
-    fetch_seller_info,
-    format_seller_info,
-    fetch_full_card_details,
+    fetch_mm_scrapers_list_async,
+    close_async_client,
+    configure_cache,
+    cache_stats,
+    scheduler_stats,
+    cached_card_names,
+)
+from shop_events import (
+    EMPTY,
+    ERROR,
+    SKIPPED,
+    STARTED,
+    TIMED_OUT,
+    stream_shop_event_frames,
+)
+from card_details import CardDetailsIndex
+from image_pipeline import (
+    DEFAULT_VIEWER_CELLS,
+    CardImageCache,
+    ThumbnailCache,
+    fit_image_size,
 )
+from price_aggregator import BestPriceAggregator, is_buylist, is_in_stock
+from search_results import group_search_results
+from best_prices_widget import BestPricesWidget
+from offers_table_widget import OffersTableWidget
+from offer_store import DEFAULT_MAX_AGE, OfferStore
+from name_index import CardNameIndex
+from name_suggestions_widget import CardNameSuggester, NameSuggestionsWidget
+from scraper_health import ScraperHealth
 from card_info_widget import CardInfoWidget  # Import the custom widget
-from text_card_info_widget import TextCardInfoWidget
+
+# Scrape fan-out limits, see fanout.fan_out_seller_info()
+SCRAPE_MAX_CONCURRENCY = 16
+SCRAPE_PER_HOST_LIMIT = 2
+SCRAPE_TIMEOUT = 10.0
+
+# Seconds between two redraws of the results while shops are answering
+FRAME_INTERVAL = 0.05
+
+# Rows in the "Lowest prices" table
+BEST_PRICES_SHOWN = 10
+
+# Seconds of typing pause before the suggestion list is refreshed
+SUGGEST_DEBOUNCE = 0.15
+
+# Lines kept in the in-app log
+LOG_MAX_LINES = 500
+
+# Where --profile appends a JSONL trace per search
+DEFAULT_TRACE_FILE = "magicscraper_trace.jsonl"
+
+logger = get_logger("app")
 
 fancy_text_title = """
 _______  _______  _______ _________ _______    _______  _______  _______  _______  _______          
@@ -39,9 +94,31 @@ class MyApp(App):
     TITLE = "Magic Search"
     SUB_TITLE = "Canada Magic Cards Search App"
 
-    def __init__(self):
+    def __init__(
+        self, log_buffer: BufferHandler = None, offer_max_age: float = DEFAULT_MAX_AGE
+    ):
         super().__init__()
+        self.log_buffer = log_buffer
         self.search_cards_result = []
+        self.search_groups = []
+        # Type-ahead for the card input, grows with every search and details lookup
+        self.name_index = CardNameIndex(os.path.join(get_cache_dir(), "card_names.json"))
+        self.name_index.add_many(cached_card_names())
+        self.card_details = CardDetailsIndex(on_response=self.name_index.add_card_details)
+        # Images already shown once come back from disk, sized for the gallery
+        self.card_images = CardImageCache(
+            self.card_details,
+            thumbnails=ThumbnailCache(os.path.join(get_cache_dir(), "thumbnails")),
+        )
+        self.hovered_card_uuid = None
+        self.scraper_health = ScraperHealth(
+            os.path.join(get_cache_dir(), "scraper_health.json")
+        )
+        # Offers priced less than offer_max_age seconds ago are shown without a scrape
+        self.offer_store = OfferStore(
+            os.path.join(get_cache_dir(), "offers.sqlite3"), max_age=offer_max_age
+        )
+        self._suggest_timer = None
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -52,8 +129,18 @@ class MyApp(App):
                     id="main-title",
                 ),
                 Label("Press enter to submit"),
-                Input(placeholder="Enter card name...", id="card-input"),
-                RichLog(id="log"),
+                Input(
+                    placeholder="Enter card name...",
+                    id="card-input",
+                    suggester=CardNameSuggester(self.name_index),
+                ),
+                NameSuggestionsWidget(self.name_index, id="name-suggestions"),
+                Horizontal(
+                    Button("Stop search", id="stop-search", classes="button"),
+                    Button("Shop health", id="show-health", classes="button"),
+                    classes="button-container",
+                ),
+                RichLog(id="log", max_lines=LOG_MAX_LINES),
                 Vertical(
                     Label("Image gallery", classes="center"),
                     id="img-gallery",
@@ -64,207 +151,368 @@ class MyApp(App):
             id="main-container",
         )
 
+    def on_mount(self) -> None:
+        self.query_one("#name-suggestions").display = False
+        if self.log_buffer is not None:
+            self.log_buffer.attach(self.query_one(RichLog).write, self.call_from_thread)
+
+    async def on_unmount(self) -> None:
+        if self.log_buffer is not None:
+            self.log_buffer.detach()
+        # Close pooled keep-alive connections while the event loop is still running
+        await close_async_client()
+        self.offer_store.close()
+        self.name_index.save()
+
     def _on_key(self, event: Key) -> None:
-        print(f"Key event: {event}")  # Does nothing lol
+        logger.debug("Key event: %s", event)  # Does nothing lol
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input.id != "card-input":
+            return
+        # Refresh the list once typing pauses rather than on every key
+        if self._suggest_timer is not None:
+            self._suggest_timer.stop()
+        self._suggest_timer = self.set_timer(
+            SUGGEST_DEBOUNCE,
+            lambda: self.query_one(NameSuggestionsWidget).update_suggestions(event.value),
+        )
+
+    def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
+        if isinstance(event.option_list, NameSuggestionsWidget):
+            card_input = self.query_one("#card-input", Input)
+            with card_input.prevent(Input.Changed):
+                card_input.value = str(event.option.prompt)
+            self.submit_search(card_input.value)
 
     async def on_input_submitted(self, event: Input.Submitted) -> None:
+        self.submit_search(event.value)
+
+    def submit_search(self, card_name: str) -> None:
+        if self._suggest_timer is not None:
+            self._suggest_timer.stop()
+        self.query_one(NameSuggestionsWidget).display = False
+
         self.query_one(RichLog).clear()
-        card_name = event.value
-        print(f"Input submitted: {card_name}")  # Debugging statement
-        self.query_one(RichLog).write(f"Card name entered: {card_name}")
+        logger.info("Card name entered: %s", card_name)
 
         # Clear the right-panel
         right_panel = self.query_one("#right-panel")
         for child in list(right_panel.children):
             child.remove()
 
-        # Create a task for the main program to keep the UI responsive
-        asyncio.create_task(self.run_main_program(card_name))
+        # Run the main program in the background to keep the UI responsive
+        self.start_page_load(self.run_main_program(card_name))
+
+    def start_page_load(self, load: Coroutine) -> None:
+        """Runs a card name lookup in the background, cancelling the previous lookup
+        and price search since their results are cleared from the screen.
+
+        It has its own worker group so a price search started from its buttons doesn't
+        cancel the card details and image prefetch it is still loading.
+        """
+        self.workers.cancel_group(self, "search")
+        self.workers.cancel_group(self, "page")
+        self.run_worker(load, group="page", exclusive=True)
+
+    def start_search(self, search: Coroutine) -> None:
+        """Runs a price search in the background, cancelling the one already running.
+
+        Cancelling the worker cancels every scrape of the fan-out, which aborts their
+        HTTP requests and frees the connections right away.
+        """
+        self.workers.cancel_group(self, "search")
+        self.run_worker(search, group="search", exclusive=True)
+
+    def stop_search(self) -> None:
+        """Cancels the running lookup and price search and any image prefetch"""
+        self.workers.cancel_group(self, "search")
+        self.workers.cancel_group(self, "page")
+        self.card_images.cancel_prefetch()
 
     async def run_main_program(self, card_name: str) -> None:
+        # Images of the previous search won't be hovered anymore
+        self.card_images.cancel_prefetch()
+
         # Remove image on new search
         img_panel = self.query_one("#img-gallery")
         for child in list(img_panel.children):
-            self.query_one(RichLog).write(f"unmounting: {child}")
-            if isinstance(child, Vertical) or isinstance(child, ImageViewer):
+            logger.debug("unmounting: %s", child)
+            if isinstance(child, Vertical) or child.has_class("card-image"):
                 child.remove()
 
+        session = profiler.begin_search(f"lookup {card_name}")
         try:
             # Outputs dict
-            self.query_one(RichLog).write("Fetching search cards...")
-            self.search_cards_result: list = await asyncio.to_thread(
-                fetch_search_cards, card_name
+            logger.info("Fetching search cards...")
+            self.search_cards_result: list = await fetch_search_cards_async(
+                card_name
             )
 
-            self.query_one(RichLog).write(
-                f"Fetch_search_cards: {self.search_cards_result}"
+            # Duplicate entries removed, printings grouped under their card name
+            self.search_groups = group_search_results(self.search_cards_result)
+            logger.info(
+                "Found %d cards, %d printings",
+                len(self.search_groups),
+                sum(len(group.printings) for group in self.search_groups),
             )
-
-            # Once you get the cards, you should display the cards for user to select the right UUID
-            for result in self.search_cards_result:
-                self.query_one(RichLog).write(f"Card: {result}")
-
-            search_cards_id = []  # Only the ID
-            for i in self.search_cards_result:
-                self.query_one(RichLog).write(f"Getting card UUID for: {i}")
-                x = await asyncio.to_thread(get_card_uuid, i)
-                search_cards_id.append(x)
+            self.name_index.add_search_results(self.search_cards_result)
+            logger.debug("Fetch_search_cards: %s", self.search_cards_result)
 
             # Layout Panels
             right_panel = self.query_one("#right-panel")
 
             ## For eventual button container
             max_buttons_per_row = 3
-            current_row = Horizontal(classes="button-container")
 
             right_panel.mount(Label("Click on the correct card you wanted to search"))
-            right_panel.mount(current_row)
-            button_count = 0
 
-            # Trying to display the list of Cards, and their UUIDs so users can click it
-
-            for card in self.search_cards_result:
-                try:
-                    self.query_one(RichLog).write(
-                        f"Adding button for card: {card['key']}"
+            # One label per card name, then a button per printing, newest first
+            for group in self.search_groups:
+                buttons = []
+                if len(group.printings) > 1:
+                    # Scrapes every printing in one fan-out
+                    button = Button(
+                        label=f"All {len(group.printings)} printings",
+                        id=f"all_{group.card_ids[0]}",
+                        classes="button",
                     )
+                    button.data_card_uuid = group.card_ids[0]
+                    button.data_card_name = group.name
+                    button.data_card_ids = group.card_ids
+                    buttons.append(button)
+
+                for card in group.printings:
                     button = Button(
-                        label=f"{card['key']}",
+                        label=card["metadata"].get("released_at") or group.name,
                         id=f"button_{card['metadata']['id']}",
                         classes="button",
                     )
-
                     button.data_card_uuid = card["metadata"]["id"]
-                    button.data_card_name = card["key"]
-
-                    self.query_one(RichLog).write(f"Button created: {button}")
-
-                    current_row.mount(button)
-                    button_count += 1
-
-                    if button_count >= max_buttons_per_row:
-                        self.query_one(RichLog).write(
-                            f"Mounting row with {button_count} buttons"
-                        )
-                        self.query_one(RichLog).write(f"Mounting in the right_panel")
-                        current_row = Horizontal(classes="button-container")
-                        right_panel.mount(current_row)
-                        button_count = 0
-                except Exception as e:
-                    self.query_one(RichLog).write(f"Error adding button: {e}")
-
-            if button_count > 0:
-                self.query_one(RichLog).write(
-                    f"Mounting last row with {button_count} buttons"
+                    button.data_card_name = group.name
+                    buttons.append(button)
+
+                right_panel.mount(Label(group.name, classes="yellow"))
+                for i in range(0, len(buttons), max_buttons_per_row):
+                    row = buttons[i : i + max_buttons_per_row]
+                    right_panel.mount(Horizontal(*row, classes="button-container"))
+                    count("widgets.mounted", len(row))
+
+            # One batched lookup for the whole page, image URLs etc. then come from memory
+            with span("stage.card_details"):
+                await self.card_details.load_async(
+                    [group.name for group in self.search_groups]
                 )
-                right_panel.mount(current_row)
 
-            #### This triggers the search
-            # await self.search_seller_stock(search_cards_id, right_panel)
+            # Start downloading every result image now so hovering shows it at once
+            self.card_images.prefetch(
+                [
+                    (card_id, group.name)
+                    for group in self.search_groups
+                    for card_id in group.card_ids
+                ],
+                self.card_image_size(),
+            )
 
         except asyncio.CancelledError:
-            try:
-                self.query_one(RichLog).write("Task was cancelled")
-            except NoMatches:
-                print("Task was cancelled and RichLog widget is not available")
+            logger.info("Task was cancelled")
+            raise
+        finally:
+            self.log_profile(session)
+
+    def log_profile(self, session) -> None:
+        """Logs the per-stage summary of a search that just ended (--profile only)"""
+        rows = profiler.end_search(session)
+        if rows:
+            logger.info(
+                "Profile of %s:\n%s",
+                session.label,
+                format_summary(rows, session.counters),
+            )
 
     async def on_enter(self, event: Enter) -> None:
-        if isinstance(event.node, Button):
+        if isinstance(event.node, Button) and hasattr(event.node, "data_card_uuid"):
             img_gallery_panel = self.query_one("#img-gallery")
 
             card_name = event.node.data_card_name
-            self.query_one(RichLog).write(
-                f"Event.node.data_card_name: {event.node.data_card_name}"
-            )
 
             ## Remove previous image
             for child in list(img_gallery_panel.children):
-                self.query_one(RichLog).write(f"unmounting: {child}")
+                logger.debug("unmounting: %s", child)
                 if (
                     isinstance(child, Horizontal)
-                    or isinstance(child, ImageViewer)
+                    or child.has_class("card-image")
                     or isinstance(child, Label)
                 ):
                     child.remove()
 
-            self.query_one(RichLog).write(f"Hovering on: {event.node.id}")
+            logger.debug("Hovering on: %s", event.node.id)
             self.on_button_hover(event.node)
 
-            ## SEARCH IMAGE HERE AS TEST [{'key': name, 'id': id, }]
-            #### Then ['image_url']
-
             if not self.search_cards_result:
-                self.query_one(RichLog).write("No search cards result available.")
+                logger.info("No search cards result available.")
                 return
 
-            image_list = [card_name]
-
-            # test_image_data = self.search_cards_result[0]["key"]
-            # self.query_one(RichLog).write(f"search image data: {test_image_data}")
-
-            # image_list.append(test_image_data)
-
-            test_image_result: dict = await asyncio.to_thread(
-                fetch_full_card_details, image_list
+            # Load in a worker so the message loop keeps going while the image downloads,
+            # exclusive so only the latest hover gets to mount its image
+            self.hovered_card_uuid = event.node.data_card_uuid
+            self.run_worker(
+                self.show_card_image(event.node.data_card_uuid, card_name),
+                group="hover-image",
+                exclusive=True,
             )
-            self.query_one(RichLog).write(f"Search image result: {test_image_result}")
-            image_url = test_image_result["cards"][0]["image_url"]
-
-            self.query_one(RichLog).write(f"img_url: {image_url}")
 
+    def card_image_size(self) -> tuple:
+        """Image size that fills the gallery panel, the same for every hover and prefetch"""
+        gallery = self.query_one("#img-gallery")
+        # The bordered title label takes 3 rows until the first image replaces it
+        cells = (gallery.content_size.width, gallery.content_size.height - 3)
+        if cells[0] <= 0 or cells[1] <= 0:
+            cells = DEFAULT_VIEWER_CELLS
+        return fit_image_size(cells)
+
+    async def show_card_image(self, card_uuid: str, card_name: str) -> None:
+        img_gallery_panel = self.query_one("#img-gallery")
+        size = self.card_image_size()
+        image = self.card_images.peek(card_uuid, size)
+        if image is None:
+            # Only a download is worth its own profile, a cached image shows at once
+            session = profiler.begin_search(f"hover {card_name}")
             try:
-                response = requests.get(image_url)
-
-                self.query_one(RichLog).write(f"Response: {response.content}")
+                with span("stage.hover_image", cached=False):
+                    image = await self.card_images.get(card_uuid, card_name, size)
+            except Exception as e:
+                logger.warning("No image for %s: %s", card_name, e)
+                img_gallery_panel.mount(Label(f"No image to display"))
+                return
+            finally:
+                self.log_profile(session)
 
-                response.raise_for_status()
+        # The mouse may have moved on while this was downloading
+        if self.hovered_card_uuid != card_uuid:
+            return
 
-                # open the image using pillow
-                image = Image.open(BytesIO(response.content))
-                self.query_one(RichLog).write(f"Image size: {image.size}")
-                image = image.resize((976, 1360), Image.LANCZOS)
+        logger.debug("Image size: %s", image.size)
+        # Imported on the first hover, it pulls in PIL
+        from textual_imageview.viewer import ImageViewer
 
-                self.query_one(RichLog).write(f"Final image: {image}")
-
-                # Display the image using ImageViewer
-                image_viewer = ImageViewer(image)
-                self.query_one("#img-gallery").mount(image_viewer)
-            except ValueError:
-                self.query_one(RichLog).write(f"Invalid img_url: {image_url}")
-                img_gallery_panel.mount(Label(f"No image to display"))
+        # Display the image using ImageViewer
+        image_viewer = ImageViewer(image)
+        image_viewer.add_class("card-image")
+        img_gallery_panel.mount(image_viewer)
+        count("widgets.mounted")
 
     def on_leave(self, event: Leave) -> None:
         if isinstance(event.node, Button):
-            self.query_one(RichLog).write(f"Left button: {event.node.id}")
+            logger.debug("Left button: %s", event.node.id)
 
     def on_button_hover(self, button: Button):
-        print(f"Hovering over button: {button.id}")
+        logger.debug("Hovering over button: %s", button.id)
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "stop-search":
+            self.stop_search()
+            logger.info("Search stopped")
+            self.query_one("#right-panel").mount(Label("SEARCH STOPPED", classes="red"))
+            return
+        if event.button.id == "show-health":
+            self.toggle_scraper_health()
+            return
+
         ## Clearing contents of RichLog
         right_panel = self.query_one("#right-panel")
         for child in list(right_panel.children):
-            self.query_one(RichLog).write(f"unmounting: {child}")
-            if isinstance(child, Horizontal) or isinstance(child, Label):
-                child.remove()
+            logger.debug("unmounting: %s", child)
+            child.remove()
 
         button = event.button
 
-        card_uuid = button.data_card_uuid
         card_name = button.data_card_name
+        ### The search_seller_stock() function needs to take in a list
+        card_list = getattr(button, "data_card_ids", [button.data_card_uuid])
 
-        self.query_one(RichLog).write(f"Button pressed: {event.button.id}")
+        logger.info("Searching shops for %s (%d printings)", card_name, len(card_list))
 
         right_panel.mount(Label(f"Searching for {card_name} now", classes="yellow"))
         right_panel.mount(
             Label(f"Just type in a new card to begin a new search", classes="yellow")
         )
-        ### The search_seller_stock() function needs to take in a list
-        card_list = [card_uuid]
-        asyncio.create_task(
+        self.start_search(
             self.search_seller_stock(card_list, self.query_one("#right-panel"))
         )
 
+    def toggle_scraper_health(self) -> None:
+        """Shows or hides the per-shop latency and breaker table on top of the results"""
+        try:
+            self.query_one("#scraper-health").remove()
+        except NoMatches:
+            from scraper_health_widget import ScraperHealthWidget
+
+            right_panel = self.query_one("#right-panel")
+            widget = ScraperHealthWidget(self.scraper_health, id="scraper-health")
+            if right_panel.children:
+                right_panel.mount(widget, before=0)
+            else:
+                right_panel.mount(widget)
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        # The selected offer is shown in full under the table
+        if isinstance(event.data_table, OffersTableWidget):
+            offer = event.data_table.get_offer(event.row_key)
+            try:
+                self.query_one("#offer-detail", CardInfoWidget).update_card_info(offer)
+            except NoMatches:
+                pass
+
+    def apply_shop_events(
+        self,
+        events: list,
+        best_prices: BestPriceAggregator,
+        best_prices_widget: BestPricesWidget,
+        offers_table: OffersTableWidget,
+    ) -> None:
+        """Renders one frame of shop events with a single update of each widget"""
+        in_stock = []
+        best_changed = False
+        for event in events:
+            scraper = event.scraper_id
+            if event.kind == STARTED:
+                logger.debug("Asking %s for %s", scraper, event.card_id)
+            elif event.kind == SKIPPED:
+                logger.info("Skipping %s: %s", scraper, event.error)
+            elif event.kind == TIMED_OUT:
+                logger.warning(
+                    "Timeout fetching seller info for card ID: %s with scraper: %s",
+                    event.card_id,
+                    scraper,
+                )
+            elif event.kind == ERROR:
+                logger.warning("Error fetching seller info from %s: %s", scraper, event.error)
+            elif event.kind == EMPTY:
+                logger.info("No seller info from %s, continuing search", scraper)
+            else:
+                logger.debug(
+                    "seller info (%s, %s): %s",
+                    scraper,
+                    "stored" if event.from_store else f"{event.elapsed:.2f}s",
+                    event.offers,
+                )
+                best_changed |= best_prices.add(event.card_id, event.offers)
+                shop_in_stock = [
+                    offer
+                    for offer in event.offers
+                    if is_in_stock(offer) and not is_buylist(offer)
+                ]
+                if not shop_in_stock:
+                    logger.info("%s out of stock", scraper)
+                in_stock.extend(shop_in_stock)
+
+        if best_changed:
+            best_prices_widget.update_offers(best_prices.top())
+        # One batch per frame, the table only lays out the rows in view
+        offers_table.add_offers(in_stock)
+        count("table.rows", len(in_stock))
+
     async def search_seller_stock(self, search_cards_id: list, panel):
         """Searches the list of UUIDs for seller price and info
 
@@ -274,84 +522,100 @@ class MyApp(App):
 
             panel (textual.container): Textual Layout panel
         """
-        # self.query_one(RichLog).clear()
-
-        # FETCH SELLER STOCK
-        for card_id in search_cards_id:
-            for scraper in fetch_mm_scrapers_list():
-                self.query_one(RichLog).write(
-                    f"Fetching seller info for card ID: {card_id} with scraper: {scraper}"
-                )
-                try:
-                    # Add timeout to the fetch_seller_info call
-                    seller_info = await asyncio.wait_for(
-                        asyncio.to_thread(fetch_seller_info, card_id, scraper),
-                        timeout=10.0,
-                    )
+        session = profiler.begin_search(f"prices {' '.join(search_cards_id)}")
+        try:
+            # FETCH SELLER STOCK
+            # The scraper list doesn't change between cards, only fetch it once
+            scrapers = await fetch_mm_scrapers_list_async()
+            if not scrapers:
+                logger.error("No scrapers available, stopping search")
+                return
 
-                    self.query_one(RichLog).write(f"seller info: {seller_info}")
-
-                    if seller_info:
-                        for seller in seller_info:
-                            self.query_one(RichLog).write(f"Seller: {seller}")
-                            self.query_one(RichLog).write(
-                                f"{seller} inStock: {seller['inStock']}"
-                            )
-
-                            # Corrected condition
-                            if seller and (
-                                seller["inStock"] or int(seller["stock"]) > 0
-                            ):
-                                panel.mount(Label(print_hash(20), classes="red"))
-                                for k, v in seller.items():
-                                    match k:
-                                        case "price":
-                                            label = Label(f"{k}: {v}", classes="green")
-                                            panel.mount(label)
-                                        case "stock":
-                                            label = Label(f"{k}: {v}", classes="green")
-                                            panel.mount(label)
-                                        case "inStock":
-                                            label = Label(f"{k}: {v}", classes="yellow")
-                                            panel.mount(label)
-                                        case "url":
-                                            label = Label(f"{k}: {v}", classes="yellow")
-                                            panel.mount(label)
-                                        case _:
-                                            label = Label(f"{k}: {v}", classes="")
-                                            panel.mount(label)
-
-                                panel.mount(Label(print_hash(20), classes="red"))
-
-                                #### BROKEN due to height issue #####
-                                ### I think it's the use of the Panel that auto has height to fill parent
-
-                                # card_info_widget = CardInfoWidget(seller_info[0])
-                                # right_panel.mount(card_info_widget)
-                            else:
-                                self.query_one(RichLog).write(f"{scraper} out of stock")
-                    else:
-                        self.query_one(RichLog).write(
-                            f"No seller info, continuing search"
-                        )
-                        continue
-                except asyncio.TimeoutError:
-                    self.query_one(RichLog).write(
-                        f"Timeout fetching seller info for card ID: {card_id} with scraper: {scraper}"
-                    )
-                except asyncio.CancelledError:
-                    self.query_one(RichLog).write("Search task was cancelled.")
-                    return
-                except Exception as e:
-                    self.query_one(RichLog).write(f"Error fetching seller info: {e}")
+            # Cheapest-first view kept up to date as offers arrive
+            best_prices = BestPriceAggregator(k=BEST_PRICES_SHOWN)
+            best_prices_widget = BestPricesWidget(id="best-prices")
+            offers_table = OffersTableWidget(id="offers-table")
+            # Shops answered out of (card, shop) pairs asked
+            progress = ProgressBar(
+                total=len(search_cards_id) * len(scrapers),
+                show_eta=False,
+                id="search-progress",
+            )
+            panel.mount(progress)
+            panel.mount(best_prices_widget)
+            panel.mount(offers_table)
+            panel.mount(CardInfoWidget(None, id="offer-detail"))
+            count("widgets.mounted", 4)
+
+            # All (card, scraper) pairs are scraped at once, every shop's events come back
+            # as soon as it answers, batched into frames so the UI updates once per frame
+            async for frame in stream_shop_event_frames(
+                search_cards_id,
+                scrapers,
+                frame_interval=FRAME_INTERVAL,
+                max_concurrency=SCRAPE_MAX_CONCURRENCY,
+                per_host_limit=SCRAPE_PER_HOST_LIMIT,
+                timeout=SCRAPE_TIMEOUT,
+                health=self.scraper_health,
+                store=self.offer_store,
+            ):
+                with span("stage.render_offers", events=len(frame)):
+                    self.apply_shop_events(frame, best_prices, best_prices_widget, offers_table)
+                progress.update(total=frame[-1].total, progress=frame[-1].done)
+        except asyncio.CancelledError:
+            logger.info("Search task was cancelled.")
+            raise
+        finally:
+            self.scraper_health.save()
+            self.log_profile(session)
 
-            # FINISHED SEARCH, DISPLAY MESSAGE
-            self.query_one(RichLog).write(f"SEARCH DONE")
-            self.query_one("#right-panel").mount(Label(f"SEARCH DONE"))
+        # FINISHED SEARCH, DISPLAY MESSAGE
+        logger.info("SEARCH DONE")
+        logger.debug("Cache stats: %s", cache_stats())
+        logger.debug("Offer store: %s", self.offer_store.stats())
+        logger.debug("Request scheduler: %s", scheduler_stats())
+        panel.mount(Label("SEARCH DONE"))
 
 
 if __name__ == "__main__":
-    app = MyApp()
+    parser = argparse.ArgumentParser(description="Canada Magic Cards Search App")
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+        help="DEBUG also logs full payloads, which is slow on big searches",
+    )
+    parser.add_argument("--log-file", help="Also write the log as JSONL to this file")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_TRACE_FILE,
+        metavar="TRACE",
+        help=f"Time every stage, log a summary per search and append a trace to TRACE (default {DEFAULT_TRACE_FILE})",
+    )
+    parser.add_argument(
+        "--seed-names",
+        metavar="FILE",
+        help="Add the card names of FILE (one per line, or scryfall's card-names JSON) to the type-ahead index",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE,
+        help=f"Seconds stored offers are shown without scraping again, 0 always scrapes (default {DEFAULT_MAX_AGE})",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(args.profile)
+
+    log_buffer = configure_logging(
+        args.log_level, jsonl_path=args.log_file, buffer_size=LOG_MAX_LINES
+    )
+    configure_cache(get_cache_dir())
+    app = MyApp(log_buffer=log_buffer, offer_max_age=args.max_age)
+    if args.seed_names:
+        app.name_index.seed(args.seed_names)
     try:
         app.run()
     except KeyboardInterrupt:
@@ -0,0 +1,294 @@
+"""Headless watchlist monitor, emits price and stock changes as a JSONL event stream.
+
+Example:
+    python monitor.py watchlist.txt --interval 3600 -o events.jsonl
+
+The watchlist holds one card UUID per line ("#" comments allowed), as taken from
+fetch_search_cards(). Every card is scraped at every shop once per interval. Each shop
+gets its own loop that walks the watchlist at an even pace, so a shop sees one request
+every interval / cards seconds instead of a burst, and the shops are staggered so the
+requests to magicmargins are spread over the interval as well.
+
+Events look like:
+    {"ts": ..., "event": "price", "card_id": ..., "scraper_id": ..., "offer_id": ...,
+     "old": {"price": 1.25, ...}, "new": {"price": 0.99, ...}}
+with event one of "new", "removed", "price" and "stock".
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from app_logging import configure_logging, get_logger
+from magicmargins import (
+    close_async_client,
+    fetch_mm_scrapers_list_async,
+    fetch_seller_info_async,
+)
+from offer_store import OfferStore
+from price_aggregator import is_in_stock, parse_price
+from scraper_health import ScraperHealth
+from utils import get_cache_dir
+
+logger = get_logger("monitor")
+
+
+def read_watchlist(path: str) -> list:
+    """Card UUIDs of a watchlist file, duplicates dropped, order kept"""
+    card_ids = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line and line not in card_ids:
+                card_ids.append(line)
+    return card_ids
+
+
+def snapshot(offers: list) -> dict:
+    """Reduces a fetch_seller_info() answer to what is diffed: offer ID -> (price, stock)
+
+    Only these small tuples are kept between rounds, so memory stays flat however long
+    the monitor runs.
+    """
+    snap = {}
+    for offer in offers or []:
+        offer_id = offer.get("id")
+        if offer_id is None:
+            continue
+        snap[offer_id] = (
+            parse_price(offer.get("price")),
+            str(offer.get("stock")),
+            is_in_stock(offer),
+        )
+    return snap
+
+
+def _state(entry: tuple) -> dict:
+    price, stock, in_stock = entry
+    return {"price": price, "stock": stock, "inStock": in_stock}
+
+
+def diff_snapshots(old: dict, new: dict) -> list:
+    """(event, offer_id, old, new) for every offer that appeared, vanished or changed"""
+    changes = []
+    for offer_id, entry in new.items():
+        before = old.get(offer_id)
+        if before is None:
+            changes.append(("new", offer_id, None, _state(entry)))
+        elif before[0] != entry[0]:
+            changes.append(("price", offer_id, _state(before), _state(entry)))
+        elif before[1:] != entry[1:]:
+            changes.append(("stock", offer_id, _state(before), _state(entry)))
+    for offer_id, entry in old.items():
+        if offer_id not in new:
+            changes.append(("removed", offer_id, _state(entry), None))
+    return changes
+
+
+class EventWriter:
+    """Appends one JSON object per event and flushes it right away, stdout if no path"""
+
+    def __init__(self, path: str = None):
+        self._file = open(path, "a", encoding="utf-8") if path else sys.stdout
+        self.events = 0
+
+    def write(self, event: dict) -> None:
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+        self.events += 1
+
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class WatchlistMonitor:
+    """Rescrapes a watchlist on a schedule and emits the differences between rounds.
+
+    Args:
+        card_ids (list): Card UUIDs to watch
+        writer (EventWriter): Where change events go
+        interval (float): Seconds between two scrapes of the same (card, shop) pair
+        timeout (float): Seconds before a single scrape is given up on
+        health (ScraperHealth, optional): Adaptive timeouts and circuit breaker per shop
+        store (OfferStore, optional): Seeds the first round so a restart doesn't report
+            every offer as new, and keeps the latest offers of every pair
+    """
+
+    def __init__(
+        self,
+        card_ids: list,
+        writer: EventWriter,
+        interval: float = 60 * 60,
+        timeout: float = 10.0,
+        health: ScraperHealth = None,
+        store: OfferStore = None,
+    ):
+        self.card_ids = list(card_ids)
+        self.writer = writer
+        self.interval = interval
+        self.timeout = timeout
+        self.health = health
+        self.store = store
+        # (card_id, scraper_id) -> snapshot(), bounded by cards x shops
+        self.snapshots = {}
+        self.counters = {"scrapes": 0, "errors": 0, "skipped": 0, "events": 0}
+
+    def spacing(self) -> float:
+        """Seconds between two requests to the same shop"""
+        return self.interval / max(1, len(self.card_ids))
+
+    async def run(self, scrapers: list, rounds: int = None) -> None:
+        """Runs one loop per shop until cancelled, or for `rounds` passes over the watchlist"""
+        if self.store is not None:
+            for card_id in self.card_ids:
+                for scraper in scrapers:
+                    offers = self.store.offers(card_id, scraper)
+                    if offers:
+                        self.snapshots[(card_id, scraper)] = snapshot(offers)
+
+        # Shop i starts i/n of a spacing late, so the shops never fire at the same instant
+        stagger = self.spacing() / max(1, len(scrapers))
+        await asyncio.gather(
+            *(
+                self._shop_loop(scraper, i * stagger, rounds)
+                for i, scraper in enumerate(scrapers)
+            )
+        )
+
+    async def _shop_loop(self, scraper: str, offset: float, rounds: int) -> None:
+        loop = asyncio.get_running_loop()
+        spacing = self.spacing()
+        next_at = loop.time() + offset
+        done = 0
+        while rounds is None or done < rounds:
+            for card_id in self.card_ids:
+                await asyncio.sleep(max(0.0, next_at - loop.time()))
+                # Scheduled from the plan, not from when the scrape ended, so slow
+                # answers don't make the shop drift
+                next_at += spacing
+                await self.scrape(card_id, scraper)
+            done += 1
+            logger.info("%s: round %d done, %s", scraper, done, self.counters)
+            if self.health is not None:
+                self.health.save()
+
+    async def scrape(self, card_id: str, scraper: str) -> None:
+        if self.health is not None and self.health.is_open(scraper):
+            logger.debug("Skipping %s, its circuit breaker is open", scraper)
+            self.counters["skipped"] += 1
+            return
+
+        timeout = self.timeout
+        if self.health is not None:
+            timeout = min(timeout, self.health.timeout_for(scraper))
+
+        start = time.monotonic()
+        timed_out = False
+        try:
+            offers = await asyncio.wait_for(fetch_seller_info_async(card_id, scraper), timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            offers = None
+            timed_out = True
+            logger.warning("%s timed out for %s after %.1fs", scraper, card_id, timeout)
+        except Exception as e:
+            offers = None
+            logger.warning("%s failed for %s: %r", scraper, card_id, e)
+        elapsed = time.monotonic() - start
+
+        if self.health is not None:
+            self.health.record(scraper, elapsed, offers is not None, timed_out=timed_out)
+        if offers is None:
+            # Keep the previous snapshot, a failed scrape says nothing about the stock
+            self.counters["errors"] += 1
+            return
+        self.counters["scrapes"] += 1
+        if self.store is not None:
+            self.store.put(card_id, scraper, offers)
+
+        key = (card_id, scraper)
+        new = snapshot(offers)
+        old = self.snapshots.get(key)
+        self.snapshots[key] = new
+        if old is None:
+            # First sighting of the pair, nothing to compare with
+            return
+        now = time.time()
+        for event, offer_id, before, after in diff_snapshots(old, new):
+            self.writer.write(
+                {
+                    "ts": now,
+                    "event": event,
+                    "card_id": card_id,
+                    "scraper_id": scraper,
+                    "offer_id": offer_id,
+                    "old": before,
+                    "new": after,
+                }
+            )
+            self.counters["events"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch card prices and emit changes as JSONL")
+    parser.add_argument("watchlist", help="File with one card UUID per line")
+    parser.add_argument("-o", "--output", help="Append events to this JSONL file, stdout if omitted")
+    parser.add_argument("--interval", type=float, default=60 * 60, help="Seconds between two scrapes of a card at a shop")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--rounds", type=int, help="Stop after this many passes over the watchlist")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--log-file", help="Also write the log as JSONL to this file")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level, jsonl_path=args.log_file, stream=True)
+
+    card_ids = read_watchlist(args.watchlist)
+    if not card_ids:
+        parser.error(f"{args.watchlist} has no card UUIDs")
+
+    health = ScraperHealth(
+        os.path.join(get_cache_dir(), "scraper_health.json"), max_timeout=args.timeout
+    )
+    store = OfferStore(os.path.join(get_cache_dir(), "offers.sqlite3"))
+    writer = EventWriter(args.output)
+    monitor = WatchlistMonitor(
+        card_ids,
+        writer,
+        interval=args.interval,
+        timeout=args.timeout,
+        health=health,
+        store=store,
+    )
+
+    async def run():
+        try:
+            scrapers = await fetch_mm_scrapers_list_async()
+            if not scrapers:
+                raise RuntimeError("Could not fetch the scraper list")
+            logger.info(
+                "Watching %d cards at %d shops, one request per shop every %.1fs",
+                len(card_ids),
+                len(scrapers),
+                monitor.spacing(),
+            )
+            await monitor.run(scrapers, rounds=args.rounds)
+        finally:
+            await close_async_client()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Stopped, %s", monitor.counters)
+    finally:
+        health.save()
+        store.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
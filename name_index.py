@@ -0,0 +1,207 @@
+import heapq
+import json
+import math
+import os
+from bisect import bisect_left, insort
+from collections import Counter
+
+from app_logging import get_logger
+
+logger = get_logger("name_index")
+
+# Dice coefficient of trigrams below which a fuzzy match is dropped, under a third in
+# common it's rarely the card that was meant
+MIN_SIMILARITY = 0.33
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class CardNameIndex:
+    """Prefix and fuzzy index over card names, for type-ahead without the network.
+
+    Names come from search and full-details responses as they are fetched, from a
+    seed file, or from the previous session's file. Lookups only touch sorted lists
+    and an inverted trigram index, so they stay around a millisecond for tens of
+    thousands of names.
+
+    Args:
+        path (str, optional): JSON file the names are loaded from and saved to
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        # normalized name -> name as the API spells it
+        self.names = {}
+        # Sorted normalized names, for prefix lookups on the whole name
+        self._sorted = []
+        # Sorted (word, normalized name), so "bolt" finds "Lightning Bolt"
+        self._words = []
+        # trigram -> normalized names containing it, for fuzzy lookups
+        self._trigrams = {}
+        self._dirty = False
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return normalize(name) in self.names
+
+    def _index(self, name: str) -> str:
+        """Indexes name everywhere but in the sorted lists, returns its key if it's new"""
+        key = normalize(name)
+        if not key or key in self.names:
+            return None
+        self.names[key] = name
+        for gram in trigrams(key):
+            self._trigrams.setdefault(gram, set()).add(key)
+        self._dirty = True
+        return key
+
+    def add(self, name: str) -> None:
+        key = self._index(name)
+        if key is not None:
+            insort(self._sorted, key)
+            for word in set(key.split()[1:]):
+                insort(self._words, (word, key))
+
+    def add_many(self, names) -> None:
+        # One sort at the end instead of an insort per name, for seeding
+        added = [key for key in map(self._index, names) if key is not None]
+        if not added:
+            return
+        self._sorted.extend(added)
+        self._sorted.sort()
+        self._words.extend(
+            (word, key) for key in added for word in set(key.split()[1:])
+        )
+        self._words.sort()
+
+    def add_search_results(self, results: list) -> None:
+        """Indexes the names of a fetch_search_cards() response"""
+        self.add_many(card["key"] for card in results or [] if card.get("key"))
+
+    def add_card_details(self, response: dict) -> None:
+        """Indexes the names of a fetch_full_card_details() response"""
+        cards = (response or {}).get("cards") or []
+        self.add_many(card["name"] for card in cards if card.get("name"))
+
+    def seed(self, path: str) -> int:
+        """Adds every name of a file, returns how many were new.
+
+        Takes a plain list (one name per line), a JSON list of names, or a JSON object
+        with the names under "data" like scryfall's card-names catalog.
+        """
+        before = len(self.names)
+        with open(path, encoding="utf-8") as f:
+            if path.lower().endswith(".json"):
+                data = json.load(f)
+                self.add_many(data["data"] if isinstance(data, dict) else data)
+            else:
+                self.add_many(line.strip() for line in f)
+        return len(self.names) - before
+
+    def prefix(self, text: str, limit: int = 10) -> list:
+        """Names starting with text, then names with a later word starting with it"""
+        key = normalize(text)
+        if not key:
+            return []
+        found = []
+        i = bisect_left(self._sorted, key)
+        while i < len(self._sorted) and len(found) < limit:
+            name = self._sorted[i]
+            if not name.startswith(key):
+                break
+            found.append(name)
+            i += 1
+        i = bisect_left(self._words, (key,))
+        while i < len(self._words) and len(found) < limit:
+            word, name = self._words[i]
+            if not word.startswith(key):
+                break
+            if name not in found:
+                found.append(name)
+            i += 1
+        return [self.names[name] for name in found]
+
+    def fuzzy(self, text: str, limit: int = 10) -> list:
+        """Names sharing the most trigrams with text, which tolerates typos.
+
+        Only the postings of the query's rarest trigrams are walked: a name needs
+        `needed` trigrams in common to reach MIN_SIMILARITY whatever its length, so it
+        holds at least one of the `len(grams) - needed + 1` rarest ones. Trigrams like
+        " th" that are in thousands of names are then only checked for the candidates.
+        """
+        key = normalize(text)
+        if not key:
+            return []
+        postings = self._trigrams
+        grams = sorted(trigrams(key), key=lambda gram: len(postings.get(gram, ())))
+        size = len(grams)
+        needed = max(1, math.ceil(MIN_SIMILARITY * size / (2 - MIN_SIMILARITY)))
+        split = size - needed + 1
+        scores = Counter()
+        for gram in grams[:split]:
+            scores.update(postings.get(gram, ()))
+        common = [postings[gram] for gram in grams[split:] if gram in postings]
+
+        matches = []
+        for name, shared in scores.items():
+            # Trigrams of the name, padded like trigrams() does
+            total = size + len(name) + 1
+            if 2 * (shared + len(common)) < MIN_SIMILARITY * total:
+                continue
+            shared += sum(name in posting for posting in common)
+            # Dice coefficient, so long names don't win just by having more trigrams
+            similarity = 2 * shared / total
+            if similarity >= MIN_SIMILARITY:
+                matches.append((similarity, name))
+        best = heapq.nsmallest(limit, matches, key=lambda match: (-match[0], match[1]))
+        return [self.names[name] for _, name in best]
+
+    def suggest(self, text: str, limit: int = 10) -> list:
+        """Prefix matches first, topped up with fuzzy matches"""
+        found = self.prefix(text, limit)
+        if len(found) < limit:
+            found += [name for name in self.fuzzy(text, limit) if name not in found]
+        return found[:limit]
+
+    def complete(self, text: str) -> str:
+        """First known name starting with text in alphabetical order, for inline completion"""
+        key = normalize(text)
+        i = bisect_left(self._sorted, key)
+        if key and i < len(self._sorted) and self._sorted[i].startswith(key):
+            return self.names[self._sorted[i]]
+        return None
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.add_many(json.load(f))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable name index %s: %s", self.path, e)
+            return
+        self._dirty = False
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self.names.values()), f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning("Could not write name index %s: %s", self.path, e)
@@ -0,0 +1,36 @@
+from textual.suggester import Suggester
+from textual.widgets import OptionList
+
+from name_index import CardNameIndex
+
+
+class CardNameSuggester(Suggester):
+    """Inline completion of the card input from the local name index, no network"""
+
+    def __init__(self, index: CardNameIndex):
+        # The index grows during the session, so a cached miss could go stale
+        super().__init__(use_cache=False, case_sensitive=False)
+        self.index = index
+
+    async def get_suggestion(self, value: str) -> str:
+        return self.index.complete(value)
+
+
+class NameSuggestionsWidget(OptionList):
+    """Known card names matching what is typed, prefix matches first then fuzzy ones"""
+
+    CSS_PATH = "styles.tcss"
+
+    def __init__(self, index: CardNameIndex, limit: int = 8, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+        self.limit = limit
+
+    def update_suggestions(self, text: str) -> None:
+        names = self.index.suggest(text, self.limit) if text.strip() else []
+        self.clear_options()
+        self.add_options(names)
+        self.display = bool(names)
+
+    class Meta:
+        css_class = "name-suggestions-widget"
@@ -0,0 +1,211 @@
+"""Compact offer records decoded once from the magicmargins scrape endpoint.
+
+fetch_seller_info() used to hand out the raw JSON dicts, and every consumer parsed
+"price" and "stock" again. Offer keeps one slotted record per offer with the numbers
+already parsed, and still reads like the old dict (offer["scraperId"], offer.get(),
+{**offer}) so existing code keeps working.
+
+orjson is used for decoding and encoding when it is installed, json otherwise.
+"""
+
+import json
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:  # Optional, only faster
+    orjson = None
+
+# JSON key -> attribute, in the order the API sends them
+FIELDS = {
+    "id": "id",
+    "type": "type",
+    "scraperId": "scraper_id",
+    "name": "name",
+    "set_name": "set_name",
+    "url": "url",
+    "price": "price",
+    "currency": "currency",
+    "foil": "foil",
+    "inStock": "in_stock",
+    "stock": "stock",
+    "borderless": "borderless",
+    "condition": "condition",
+}
+_KEYS = frozenset(FIELDS)
+
+# How shops spell a condition -> one short code, so "Near Mint" offers compare equal to
+# "NM" ones. Keys are lowercase with dashes turned into spaces, see normalize_condition()
+CONDITION_ALIASES = {
+    "nm": "nm",
+    "near mint": "nm",
+    "lp": "lp",
+    "lightly played": "lp",
+    "sp": "lp",
+    "slightly played": "lp",
+    "mp": "mp",
+    "moderately played": "mp",
+    "pl": "mp",
+    "played": "mp",
+    "hp": "hp",
+    "heavily played": "hp",
+    "dmg": "dmg",
+    "damaged": "dmg",
+}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        number = _to_float(value)
+        return int(number) if number is not None else None
+
+
+def loads(data):
+    """Decodes JSON bytes or text, with orjson when it's available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def normalize_condition(condition) -> str:
+    """Short code of a condition ("Near Mint" -> "nm"), unknown ones lowercased, "" if missing"""
+    if not isinstance(condition, str):
+        return ""
+    key = " ".join(condition.lower().replace("-", " ").split())
+    return CONDITION_ALIASES.get(key, key)
+
+
+def _default(obj):
+    if isinstance(obj, Offer):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> str:
+    """Encodes to JSON text, Offers included"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return json.dumps(obj, default=_default)
+
+
+class Offer(Mapping):
+    """One shop offer with price as a float and stock as an int (None if unparseable).
+
+    Read-only mapping over the API's JSON keys for backward compatibility. Keys the
+    API adds later are kept in `extra`.
+    """
+
+    __slots__ = tuple(FIELDS.values()) + ("extra",)
+
+    def __init__(
+        self,
+        id: str = None,
+        type: str = None,
+        scraper_id: str = None,
+        name: str = None,
+        set_name: str = None,
+        url: str = None,
+        price: float = None,
+        currency: str = None,
+        foil: bool = False,
+        in_stock: bool = False,
+        stock: int = None,
+        borderless: bool = False,
+        condition: str = None,
+        extra: dict = None,
+    ):
+        self.id = id
+        self.type = type
+        self.scraper_id = scraper_id
+        self.name = name
+        self.set_name = set_name
+        self.url = url
+        self.price = _to_float(price)
+        self.currency = currency
+        self.foil = bool(foil)
+        self.in_stock = bool(in_stock)
+        self.stock = _to_int(stock)
+        self.borderless = bool(borderless)
+        self.condition = condition
+        self.extra = extra
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Offer":
+        extra = None
+        if not data.keys() <= _KEYS:
+            extra = {k: v for k, v in data.items() if k not in FIELDS}
+        return cls(
+            data.get("id"),
+            data.get("type"),
+            data.get("scraperId"),
+            data.get("name"),
+            data.get("set_name"),
+            data.get("url"),
+            data.get("price"),
+            data.get("currency"),
+            data.get("foil"),
+            data.get("inStock"),
+            data.get("stock"),
+            data.get("borderless"),
+            data.get("condition"),
+            extra,
+        )
+
+    @property
+    def is_in_stock(self) -> bool:
+        """Same rule the UI has always used: inStock flag or a positive stock count"""
+        return self.in_stock or (self.stock or 0) > 0
+
+    def to_dict(self) -> dict:
+        data = {key: getattr(self, attr) for key, attr in FIELDS.items()}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key: str):
+        attr = FIELDS.get(key)
+        if attr is not None:
+            return getattr(self, attr)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return len(FIELDS) + len(self.extra or ())
+
+    def __repr__(self) -> str:
+        return (
+            f"Offer({self.scraper_id!r}, {self.name!r}, {self.set_name!r},"
+            f" price={self.price!r}, stock={self.stock!r}, condition={self.condition!r},"
+            f" foil={self.foil!r})"
+        )
+
+
+def decode_offers(data) -> list:
+    """Decodes a fetch_seller_info() payload (bytes, text or already parsed) to Offers"""
+    if isinstance(data, (bytes, str)):
+        data = loads(data)
+    if data is None:
+        return None
+    return [Offer.from_json(offer) for offer in data]
+
+
+def format_price(price) -> str:
+    """Two decimals for numbers, anything else as is"""
+    if isinstance(price, (int, float)) and not isinstance(price, bool):
+        return f"{price:.2f}"
+    return "" if price is None else f"{price}"
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import time
+
+from instrumentation import count, span
+from offer_model import Offer, dumps, loads
+from price_aggregator import is_in_stock, parse_price
+
+# Default age in seconds after which a (card, scraper) pair is scraped again
+DEFAULT_MAX_AGE = 15 * 60
+
+# Card ids bound per IN (...) list, under SQLite's limit on query parameters
+MAX_IDS_PER_QUERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrapes (
+    card_id TEXT NOT NULL,
+    scraper_id TEXT NOT NULL,
+    scraped_at REAL NOT NULL,
+    PRIMARY KEY (card_id, scraper_id)
+);
+CREATE TABLE IF NOT EXISTS offers (
+    card_id TEXT NOT NULL,
+    scraper_id TEXT NOT NULL,
+    condition TEXT,
+    foil INTEGER NOT NULL,
+    price REAL,
+    in_stock INTEGER NOT NULL,
+    scraped_at REAL NOT NULL,
+    offer TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offers_by_pair
+    ON offers (card_id, scraper_id, condition, foil);
+"""
+
+
+class OfferStore:
+    """SQLite store of the offers returned by fetch_seller_info(), one row per offer.
+
+    Every (card, scraper) scrape is recorded in `scrapes` with its time, even when the
+    shop returned no offers, so an empty answer is as reusable as a full one. Pairs
+    scraped less than `max_age` seconds ago are served from the store instead of the
+    network, see fan_out_seller_info(store=...).
+
+    Args:
+        path (str): SQLite file, ":memory:" for a throwaway store
+        max_age (float): Seconds a scrape stays fresh, 0 always scrapes again
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The UI writes from its event loop thread, bulk from the asyncio.run() thread
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def is_fresh(self, scraped_at: float, max_age: float = None) -> bool:
+        max_age = self.max_age if max_age is None else max_age
+        return scraped_at is not None and time.time() - scraped_at < max_age
+
+    def fresh_pairs(self, card_ids: list, scrapers: list, max_age: float = None) -> set:
+        """(card_id, scraper_id) pairs scraped less than max_age seconds ago"""
+        max_age = self.max_age if max_age is None else max_age
+        if max_age <= 0 or not card_ids:
+            self.misses += len(card_ids) * len(set(scrapers))
+            return set()
+        cutoff = time.time() - max_age
+        wanted = set(scrapers)
+        fresh = set()
+        for chunk in _chunks(card_ids):
+            rows = self._db.execute(
+                f"SELECT card_id, scraper_id FROM scrapes"
+                f" WHERE card_id IN ({','.join('?' * len(chunk))}) AND scraped_at > ?",
+                (*chunk, cutoff),
+            )
+            fresh.update(
+                (card_id, scraper) for card_id, scraper in rows if scraper in wanted
+            )
+        self.hits += len(fresh)
+        self.misses += len(card_ids) * len(wanted) - len(fresh)
+        count("offer_store.hits", len(fresh))
+        return fresh
+
+    def get(self, card_id: str, scraper_id: str, max_age: float = None) -> list:
+        """Stored offers of a pair, or None if it was never scraped or is too old"""
+        row = self._db.execute(
+            "SELECT scraped_at FROM scrapes WHERE card_id = ? AND scraper_id = ?",
+            (card_id, scraper_id),
+        ).fetchone()
+        if row is None or not self.is_fresh(row[0], max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        count("offer_store.hits")
+        return self.offers(card_id, scraper_id)
+
+    def offers(
+        self,
+        card_id: str,
+        scraper_id: str = None,
+        condition: str = None,
+        foil: bool = None,
+    ) -> list:
+        """Stored offers of a card regardless of age, optionally narrowed down"""
+        query = "SELECT offer FROM offers WHERE card_id = ?"
+        params = [card_id]
+        if scraper_id is not None:
+            query += " AND scraper_id = ?"
+            params.append(scraper_id)
+        if condition is not None:
+            query += " AND condition = ?"
+            params.append(condition)
+        if foil is not None:
+            query += " AND foil = ?"
+            params.append(int(foil))
+        # rowid keeps the order the shop returned them in
+        query += " ORDER BY rowid"
+        rows = self._db.execute(query, params)
+        return [Offer.from_json(loads(offer)) for (offer,) in rows]
+
+    def price_rows(self, card_ids: list = None, max_age: float = None):
+        """Streams the columns price analytics need, one tuple per stored offer.
+
+        The JSON fields are extracted by SQLite, so no offer is decoded in Python.
+
+        Args:
+            card_ids (list, optional): Only these cards, every stored card if None
+            max_age (float, optional): Only pairs scraped less than this many seconds ago
+
+        Yields:
+            tuple: (card_id, scraper_id, name, set_name, condition, foil, price,
+                in_stock, type, currency)
+        """
+        query = (
+            "SELECT card_id, scraper_id, json_extract(offer, '$.name'),"
+            " json_extract(offer, '$.set_name'), condition, foil, price, in_stock,"
+            " json_extract(offer, '$.type'), json_extract(offer, '$.currency')"
+            " FROM offers WHERE scraped_at > ?"
+        )
+        cutoff = time.time() - max_age if max_age is not None else 0.0
+        if card_ids is None:
+            chunks = [None]
+        else:
+            chunks = _chunks(card_ids)
+        for chunk in chunks:
+            if chunk is None:
+                cursor = self._db.execute(query, (cutoff,))
+            else:
+                cursor = self._db.execute(
+                    f"{query} AND card_id IN ({','.join('?' * len(chunk))})",
+                    (cutoff, *chunk),
+                )
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                yield from rows
+
+    def put(self, card_id: str, scraper_id: str, offers: list) -> None:
+        """Replaces the offers of a pair with the ones just scraped"""
+        now = time.time()
+        rows = [
+            (
+                card_id,
+                scraper_id,
+                offer.get("condition"),
+                int(bool(offer.get("foil"))),
+                parse_price(offer.get("price")),
+                int(is_in_stock(offer)),
+                now,
+                dumps(offer),
+            )
+            for offer in offers or []
+        ]
+        with span("offer_store.put", scraper=scraper_id), self._db:
+            self._db.execute(
+                "DELETE FROM offers WHERE card_id = ? AND scraper_id = ?",
+                (card_id, scraper_id),
+            )
+            self._db.executemany("INSERT INTO offers VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute(
+                "INSERT OR REPLACE INTO scrapes VALUES (?, ?, ?)",
+                (card_id, scraper_id, now),
+            )
+
+    def prune(self, older_than: float) -> int:
+        """Deletes pairs scraped more than older_than seconds ago, returns how many"""
+        cutoff = time.time() - older_than
+        with self._db:
+            self._db.execute("DELETE FROM offers WHERE scraped_at < ?", (cutoff,))
+            deleted = self._db.execute(
+                "DELETE FROM scrapes WHERE scraped_at < ?", (cutoff,)
+            ).rowcount
+        return deleted
+
+    def stats(self) -> dict:
+        pairs, = self._db.execute("SELECT COUNT(*) FROM scrapes").fetchone()
+        offers, = self._db.execute("SELECT COUNT(*) FROM offers").fetchone()
+        return {"pairs": pairs, "offers": offers, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def _chunks(card_ids: list) -> list:
+    return [
+        card_ids[i : i + MAX_IDS_PER_QUERY]
+        for i in range(0, len(card_ids), MAX_IDS_PER_QUERY)
+    ]
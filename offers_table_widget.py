@@ -0,0 +1,82 @@
+from textual.widgets import DataTable
+
+from offer_model import format_price
+from price_aggregator import parse_price
+
+# (offer key, column label), in display order
+OFFER_COLUMNS = [
+    ("price", "Price"),
+    ("currency", "Cur."),
+    ("scraperId", "Shop"),
+    ("set_name", "Set"),
+    ("condition", "Cond."),
+    ("foil", "Foil"),
+    ("borderless", "Borderless"),
+    ("stock", "Stock"),
+    ("name", "Name"),
+]
+
+# Columns sorted as numbers instead of text
+NUMERIC_COLUMNS = {"price", "stock"}
+
+
+def _numeric_sort_key(value):
+    number = parse_price(value)
+    # Unparseable values go last
+    return (number is None, number or 0.0)
+
+
+def _cell(offer, key: str) -> str:
+    value = offer.get(key)
+    if key == "price":
+        return format_price(value)
+    return "" if value is None else f"{value}"
+
+
+class OffersTableWidget(DataTable):
+    """One row per in-stock offer.
+
+    DataTable only renders the rows in view, so thousands of offers cost the same to
+    lay out as a screenful. Click a header to sort by it, click again to reverse.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(cursor_type="row", zebra_stripes=True, **kwargs)
+        # row key -> offer dict, for the detail view
+        self.offers = {}
+        self.sort_column = None
+        self.sort_reverse = False
+        # Added here rather than on mount, so rows can be added before the table is shown
+        for key, label in OFFER_COLUMNS:
+            self.add_column(label, key=key)
+
+    def add_offers(self, offers: list) -> None:
+        """Adds a batch of offers (e.g. one shop's results) in a single update"""
+        if not offers:
+            return
+        rows = [[_cell(offer, key) for key, _ in OFFER_COLUMNS] for offer in offers]
+        for row_key, offer in zip(self.add_rows(rows), offers):
+            self.offers[row_key] = offer
+        if self.sort_column is not None:
+            self._apply_sort()
+
+    def get_offer(self, row_key) -> dict:
+        return self.offers.get(row_key)
+
+    def clear_offers(self) -> None:
+        self.clear()
+        self.offers.clear()
+
+    def sort_by(self, column: str, reverse: bool = False) -> None:
+        self.sort_column = column
+        self.sort_reverse = reverse
+        self._apply_sort()
+
+    def on_data_table_header_selected(self, event: DataTable.HeaderSelected) -> None:
+        column = event.column_key.value
+        reverse = not self.sort_reverse if column == self.sort_column else False
+        self.sort_by(column, reverse)
+
+    def _apply_sort(self) -> None:
+        key = _numeric_sort_key if self.sort_column in NUMERIC_COLUMNS else str.lower
+        self.sort(self.sort_column, key=key, reverse=self.sort_reverse)
@@ -0,0 +1,125 @@
+from bisect import insort
+from heapq import merge
+from itertools import count, islice
+
+from offer_model import Offer, normalize_condition
+
+
+def parse_price(value) -> float:
+    """Prices come back as numbers or strings like "1.25", returns None if unparseable"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_in_stock(offer: dict) -> bool:
+    """Same rule the UI has always used: inStock flag or a positive stock count"""
+    if isinstance(offer, Offer):
+        return offer.is_in_stock
+    if offer.get("inStock"):
+        return True
+    try:
+        return int(offer.get("stock") or 0) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def is_buylist(offer: dict) -> bool:
+    """Buylist offers are what a shop pays for a card, not a price it sells at"""
+    return offer.get("type") == "buy"
+
+
+class BestPriceAggregator:
+    """Keeps the running top-k cheapest in-stock sell offers per card as offers arrive.
+
+    Each (card, currency) holds at most k entries kept sorted on insert, so adding an
+    offer costs O(k) at worst and reading the cheapest-first view never sorts anything.
+    Prices in different currencies are never ranked against each other.
+
+    Args:
+        k (int): Offers kept per card
+        conditions (set, optional): Allowed conditions (e.g. {"NM", "LP"}), any if None.
+            Spellings are matched through normalize_condition(), "NM" allows "Near Mint"
+        foil (bool, optional): Only foils if True, only non foils if False, both if None
+        borderless (bool, optional): Same as foil for borderless printings
+    """
+
+    def __init__(
+        self,
+        k: int = 10,
+        conditions: set = None,
+        foil: bool = None,
+        borderless: bool = None,
+    ):
+        self.k = k
+        self.conditions = {normalize_condition(c) for c in conditions} if conditions else None
+        self.foil = foil
+        self.borderless = borderless
+        # card_id -> {currency: [(price, seq, offer)]}, seq breaks ties without
+        # comparing dicts
+        self._best = {}
+        self._seq = count()
+
+    def accepts(self, offer: dict) -> bool:
+        if not offer or is_buylist(offer) or not is_in_stock(offer):
+            return False
+        if self.conditions and normalize_condition(offer.get("condition")) not in self.conditions:
+            return False
+        if self.foil is not None and bool(offer.get("foil")) != self.foil:
+            return False
+        if self.borderless is not None and bool(offer.get("borderless")) != self.borderless:
+            return False
+        return parse_price(offer.get("price")) is not None
+
+    def add(self, card_id: str, offers: list) -> bool:
+        """Feeds the offers of one fetch_seller_info() call.
+
+        Returns:
+            bool: True if the top-k of the card changed, i.e. a view needs a refresh
+        """
+        by_currency = self._best.setdefault(card_id, {})
+        changed = False
+        for offer in offers or []:
+            if not self.accepts(offer):
+                continue
+            best = by_currency.setdefault(offer.get("currency") or "", [])
+            price = parse_price(offer["price"])
+            if len(best) >= self.k and price >= best[-1][0]:
+                continue
+            insort(best, (price, next(self._seq), offer))
+            if len(best) > self.k:
+                best.pop()
+            changed = True
+        return changed
+
+    def currencies(self, card_id: str = None) -> list:
+        """Currencies with offers for a card, or for any card if card_id is None"""
+        if card_id is not None:
+            return sorted(self._best.get(card_id, {}))
+        return sorted({c for by_currency in self._best.values() for c in by_currency})
+
+    def top(self, card_id: str = None, limit: int = None, currency: str = None) -> list:
+        """Cheapest-first offers of a card, or across every card if card_id is None.
+
+        With a currency, only the offers in it. Otherwise every currency's cheapest-first
+        offers, `limit` of each, one currency after the other in alphabetical order.
+        """
+        limit = limit or self.k
+        cards = [self._best.get(card_id, {})] if card_id is not None else self._best.values()
+        currencies = [currency] if currency is not None else self.currencies(card_id)
+        offers = []
+        for code in currencies:
+            # Every list is already sorted, merging them is enough
+            entries = merge(*(by_currency.get(code, []) for by_currency in cards))
+            offers.extend(offer for _, _, offer in islice(entries, limit))
+        return offers
+
+    def pop(self, card_id: str) -> list:
+        """Returns the offers of a card like top(card_id) and forgets them"""
+        offers = self.top(card_id)
+        self._best.pop(card_id, None)
+        return offers
+
+    def clear(self) -> None:
+        self._best.clear()
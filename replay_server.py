@@ -0,0 +1,311 @@
+"""Local stand-in for the magicmargins API, for benchmarks and offline work.
+
+Serves /v1/cards (search and full details), /v1/scrapers and
+/v1/scrapers/{id}/scrape/{card} from recorded fixtures such as sampleFullCardSearch.json.
+Names that aren't in the fixtures get a synthetic card, so any card list resolves.
+Shop latency, jitter and error rate are configurable per scraper.
+
+Example:
+    python replay_server.py --port 8765 --config replay.json
+    MAGICMARGINS_BASE_URL=http://127.0.0.1:8765 python main.py
+
+replay.json looks like:
+    {"default": {"latency": 0.2, "jitter": 0.1, "error_rate": 0.0},
+     "scrapers": {"401games": {"latency": 2.0, "error_rate": 0.2}}}
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_FIXTURES = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sampleFullCardSearch.json"),
+)
+
+# Same shops the real API returned when fetch_mm_scrapers_list() was written
+DEFAULT_SCRAPERS = [
+    "facetofacegames",
+    "kanatacg",
+    "401games",
+    "fusiongamingonline",
+    "kesselrungames",
+    "gamezilla",
+    "comichunter",
+    "multizone",
+    "cartamagica",
+    "cardshoptolaria",
+    "vortexgames",
+    "magicstronghold",
+    "everythinggames",
+    "gauntletgamesvictoria",
+    "gameknight",
+    "allaboardgames",
+]
+
+DEFAULT_PROFILE = {"latency": 0.05, "jitter": 0.02, "error_rate": 0.0}
+
+CONDITIONS = ["NM", "LP", "MP", "HP", "DMG"]
+
+SCRAPE_PATH = re.compile(r"^/v1/scrapers/([^/]+)/scrape/([^/]+)$")
+IMAGE_PATH = re.compile(r"^/images/([^/]+)\.jpg$")
+
+
+class ReplayConfig:
+    """Scrapers served and how each of them behaves.
+
+    Args:
+        scrapers (list, optional): Scraper IDs, DEFAULT_SCRAPERS if None
+        default (dict, optional): latency/jitter/error_rate used by every scraper
+        per_scraper (dict, optional): Overrides of `default` keyed by scraper ID
+        seed (int): Seed of the offer generator, same seed gives the same offers
+    """
+
+    def __init__(
+        self,
+        scrapers: list = None,
+        default: dict = None,
+        per_scraper: dict = None,
+        seed: int = 0,
+    ):
+        self.scrapers = scrapers or list(DEFAULT_SCRAPERS)
+        self.default = {**DEFAULT_PROFILE, **(default or {})}
+        self.per_scraper = per_scraper or {}
+        self.seed = seed
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayConfig":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            scrapers=data.get("scraper_ids"),
+            default=data.get("default"),
+            per_scraper=data.get("scrapers"),
+            seed=data.get("seed", 0),
+        )
+
+    def profile(self, scraper: str) -> dict:
+        return {**self.default, **self.per_scraper.get(scraper, {})}
+
+
+class ReplayData:
+    """Cards known to the server, from fixtures plus synthesized on demand"""
+
+    def __init__(self, fixtures: list, base_url: str, seed: int = 0):
+        self.base_url = base_url
+        self.seed = seed
+        self.by_name = {}
+        self.by_id = {}
+        self._lock = threading.Lock()
+        for path in fixtures:
+            with open(path, encoding="utf-8") as f:
+                for card in json.load(f)["cards"]:
+                    self._add(dict(card))
+
+    def _add(self, card: dict) -> dict:
+        # Images are served locally so hover benchmarks don't hit scryfall
+        card["image_url"] = f"{self.base_url}/images/{card['id']}.jpg"
+        card["large_image_url"] = card["image_url"]
+        self.by_name.setdefault(card["name"].lower(), []).append(card)
+        self.by_id[card["id"]] = card
+        return card
+
+    def _synthesize(self, name: str) -> dict:
+        card_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"magicscraper-replay/{name.lower()}"))
+        return self._add(
+            {
+                "id": card_id,
+                "name": name,
+                "set": "rpl",
+                "set_name": "Replay Set",
+                "legalities": {"commander": "legal"},
+                "rarity": "common",
+                "released_at": "2020-01-01",
+            }
+        )
+
+    def search(self, query: str) -> list:
+        query = query.lower().strip()
+        with self._lock:
+            matches = [
+                card
+                for name, cards in self.by_name.items()
+                if query in name
+                for card in cards
+            ]
+            if not matches and query:
+                matches = [self._synthesize(query.title())]
+        return [
+            {"key": c["name"], "metadata": {"id": c["id"], "released_at": c["released_at"]}}
+            for c in matches
+        ]
+
+    def details(self, names: list) -> list:
+        cards = []
+        with self._lock:
+            for name in names:
+                known = self.by_name.get(name.lower())
+                cards.append(known[0] if known else self._synthesize(name))
+        return cards
+
+    def name_of(self, card_id: str) -> str:
+        card = self.by_id.get(card_id)
+        return card["name"] if card else card_id
+
+    def offers(self, card_id: str, scraper: str) -> list:
+        """Deterministic offers of a shop for a card"""
+        digest = hashlib.sha256(f"{self.seed}/{card_id}/{scraper}".encode()).digest()
+        rng = random.Random(digest)
+        base_price = round(rng.uniform(0.25, 40.0), 2)
+        offers = []
+        for i in range(rng.randint(0, 4)):
+            foil = rng.random() < 0.3
+            stock = rng.choice([0, 0, 1, 2, 4, 8])
+            offers.append(
+                {
+                    "id": f"{scraper}-{card_id}-{i}",
+                    "type": "sell" if rng.random() < 0.8 else "buy",
+                    "scraperId": scraper,
+                    "name": self.name_of(card_id),
+                    "set_name": "Replay Set",
+                    "url": f"https://{scraper}.example/products/{card_id}",
+                    "price": f"{base_price * (1.8 if foil else 1.0) * rng.uniform(0.8, 1.2):.2f}",
+                    "currency": "CAD",
+                    "foil": foil,
+                    "inStock": stock > 0,
+                    "stock": str(stock),
+                    "borderless": rng.random() < 0.1,
+                    "condition": rng.choice(CONDITIONS),
+                }
+            )
+        return offers
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # Keep-alive, the clients pool their connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        self._send(status, json.dumps(payload).encode(), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        path = unquote(url.path)
+
+        if path == "/v1/cards":
+            query = parse_qs(url.query).get("search", [""])[0]
+            return self._send_json(200, {"cards": server.data.search(query)})
+        if path == "/v1/scrapers":
+            scrapers = [
+                {"id": s, "url": f"https://{s}.example", "buylist": True, "selllist": True}
+                for s in server.config.scrapers
+            ]
+            return self._send_json(200, scrapers)
+
+        match = SCRAPE_PATH.match(path)
+        if match:
+            scraper, card_id = match.groups()
+            profile = server.config.profile(scraper)
+            delay = profile["latency"] + random.uniform(-1, 1) * profile["jitter"]
+            time.sleep(max(0.0, delay))
+            if random.random() < profile["error_rate"]:
+                return self._send_json(500, {"error": "replayed failure"})
+            return self._send_json(200, server.data.offers(card_id, scraper))
+
+        match = IMAGE_PATH.match(path)
+        if match:
+            return self._send(200, server.card_image(), "image/jpeg")
+
+        self._send_json(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+        if urlparse(self.path).path != "/v1/cards":
+            return self._send_json(404, {"error": f"unknown path {self.path}"})
+        cards = self.server.data.details(payload.get("cardNames", []))
+        self._send_json(200, {"cards": cards})
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, config: ReplayConfig, fixtures: list):
+        super().__init__(address, ReplayHandler)
+        self.config = config
+        self.data = ReplayData(fixtures, self.base_url, seed=config.seed)
+        self._image = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def card_image(self) -> bytes:
+        """One JPEG the size of a scryfall "normal" image, generated on first use"""
+        if self._image is None:
+            from PIL import Image
+
+            buffer = BytesIO()
+            Image.new("RGB", (488, 680), (120, 40, 30)).save(buffer, "JPEG", quality=85)
+            self._image = buffer.getvalue()
+        return self._image
+
+
+def start_replay_server(
+    config: ReplayConfig = None,
+    fixtures: list = DEFAULT_FIXTURES,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ReplayServer:
+    """Starts the server in a daemon thread, port 0 picks a free one.
+
+    Returns:
+        ReplayServer: Use .base_url to point magicmargins at it, .shutdown() to stop it
+    """
+    server = ReplayServer((host, port), config or ReplayConfig(), list(fixtures))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the magicmargins API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON file with per-scraper latency, jitter and error rate")
+    parser.add_argument("--fixture", action="append", help="Card fixture JSON, repeatable")
+    args = parser.parse_args()
+
+    config = ReplayConfig.load(args.config) if args.config else ReplayConfig()
+    server = ReplayServer((args.host, args.port), config, args.fixture or list(DEFAULT_FIXTURES))
+    print(f"Serving on {server.base_url}, set MAGICMARGINS_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
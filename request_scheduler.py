@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+
+from instrumentation import count
+from utils import percentile
+
+# Wait times kept per bucket for the stats
+WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `burst`.
+
+    Waiters are served in arrival order. A rate of 0 or None never waits.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        # The lock queues waiters FIFO, only the head of the queue sleeps for a token
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class BucketStats:
+    """Queue depth and wait times of one bucket"""
+
+    def __init__(self):
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def to_json(self, name: str) -> dict:
+        waits = list(self.waits)
+        return {
+            "bucket": name,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": percentile(waits, 0.95) or 0.0,
+            "max_wait": max(waits, default=0.0),
+        }
+
+
+class RequestScheduler:
+    """Rate limits requests per bucket and coalesces identical in-flight requests.
+
+    Every request has a bucket (an endpoint like "search", or "scrape:<scraper ID>") and
+    a key identifying what it asks for. While a request with some key is in flight, any
+    other call with the same key awaits that request instead of sending its own. Only
+    the first call goes through the bucket's token bucket.
+
+    Must be used from a single event loop, like AsyncMagicMarginsClient.
+
+    Args:
+        limits (dict): Bucket name -> (rate per second, burst). Buckets named
+            "<prefix>:<something>" fall back to the "<prefix>" entry, so "scrape" sets
+            the limit of every scraper. Buckets without an entry are not limited
+    """
+
+    def __init__(self, limits: dict = None):
+        self.limits = dict(limits or {})
+        self._buckets = {}
+        self._stats = {}
+        # key -> [task, callers still awaiting it]
+        self._in_flight = {}
+
+    def _bucket(self, name: str) -> TokenBucket:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            rate, burst = self.limits.get(name) or self.limits.get(
+                name.split(":", 1)[0], (None, 1)
+            )
+            bucket = self._buckets[name] = TokenBucket(rate, burst)
+        return bucket
+
+    def _bucket_stats(self, name: str) -> BucketStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = BucketStats()
+        return stats
+
+    async def call(self, bucket: str, key: tuple, request):
+        """Runs `await request()` once its bucket allows it, or joins the identical call.
+
+        Args:
+            bucket (str): Rate limit bucket, e.g. "card_details" or "scrape:401games"
+            key (tuple): What is requested, equal keys share one request
+            request (Callable): Coroutine function doing the actual request
+
+        Returns:
+            Whatever request() returns, the same object for every coalesced caller
+        """
+        stats = self._bucket_stats(bucket)
+        entry = self._in_flight.get(key)
+        if entry is not None:
+            stats.coalesced += 1
+            count("scheduler.coalesced")
+        else:
+            task = asyncio.ensure_future(self._run(bucket, stats, request))
+            entry = self._in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, entry))
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            # Shielded so a cancelled caller doesn't abort the request of the others
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Nobody wants the answer anymore, a later identical call starts afresh
+                self._forget(key, entry)
+                task.cancel()
+
+    def _forget(self, key: tuple, entry: list) -> None:
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+    async def _run(self, name: str, stats: BucketStats, request):
+        stats.waiting += 1
+        stats.max_waiting = max(stats.max_waiting, stats.waiting)
+        start = time.monotonic()
+        try:
+            await self._bucket(name).acquire()
+        finally:
+            stats.waiting -= 1
+        wait = time.monotonic() - start
+        stats.waits.append(wait)
+        stats.requests += 1
+        count("scheduler.wait_ms", round(wait * 1000))
+        return await request()
+
+    def queue_depth(self) -> int:
+        """Requests waiting for a token across every bucket"""
+        return sum(stats.waiting for stats in self._stats.values())
+
+    def stats(self) -> list:
+        """One dict per bucket, longest p95 wait first"""
+        rows = [stats.to_json(name) for name, stats in self._stats.items()]
+        rows.sort(key=lambda row: row["p95_wait"], reverse=True)
+        return rows
@@ -0,0 +1,194 @@
+import json
+import os
+import time
+from collections import deque
+
+from app_logging import get_logger
+from utils import percentile
+
+logger = get_logger("scraper_health")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of scraping a shop whose circuit breaker is open"""
+
+
+class ScraperStats:
+    """Rolling window of one scraper's latencies and outcomes"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        # Seconds waited by the last scrape if it timed out, 0 once one succeeds
+        self.last_timeout = 0.0
+        # Wall clock, so an open breaker survives a restart
+        self.open_until = 0.0
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def to_json(self) -> dict:
+        return {
+            "latencies": list(self.latencies),
+            "outcomes": list(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "last_timeout": self.last_timeout,
+            "open_until": self.open_until,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict, window: int) -> "ScraperStats":
+        stats = cls(window)
+        stats.latencies.extend(data.get("latencies", []))
+        stats.outcomes.extend(data.get("outcomes", []))
+        stats.consecutive_failures = data.get("consecutive_failures", 0)
+        stats.last_timeout = data.get("last_timeout", 0.0)
+        stats.open_until = data.get("open_until", 0.0)
+        return stats
+
+
+class ScraperHealth:
+    """Per-scraper latency tracking, adaptive timeouts and a circuit breaker.
+
+    A scrape that raises, times out or returns None (non-200 from fetch_seller_info)
+    counts as a failure. After `failure_threshold` failures in a row the shop is
+    skipped for `cooldown` seconds. Once the cooldown is over the shop is scraped
+    again, and a single failure reopens the breaker straight away.
+
+    Args:
+        path (str, optional): JSON file the stats are loaded from and saved to
+        window (int): Scrapes kept per scraper for the rolling stats
+        min_timeout (float): Lower bound of the adaptive timeout
+        max_timeout (float): Upper bound, also used until there are enough samples
+        timeout_factor (float): Adaptive timeout is p95 latency times this
+        failure_threshold (int): Failures in a row that open the breaker
+        cooldown (float): Seconds a shop is skipped once its breaker opens
+    """
+
+    MIN_SAMPLES = 5
+
+    def __init__(
+        self,
+        path: str = None,
+        window: int = 50,
+        min_timeout: float = 2.0,
+        max_timeout: float = 10.0,
+        timeout_factor: float = 1.5,
+        failure_threshold: int = 3,
+        cooldown: float = 5 * 60,
+    ):
+        self.path = path
+        self.window = window
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.stats = {}
+        if path:
+            self.load()
+
+    def _get(self, scraper: str) -> ScraperStats:
+        stats = self.stats.get(scraper)
+        if stats is None:
+            stats = self.stats[scraper] = ScraperStats(self.window)
+        return stats
+
+    def record(self, scraper: str, elapsed: float, ok: bool, timed_out: bool = False) -> None:
+        """Records one scrape.
+
+        A timeout is kept as a censored latency sample at the time waited, since the
+        answer would have taken at least that long, and the next timeout of the shop
+        is raised by `timeout_factor` over it. Otherwise a shop that got slower keeps
+        the tight timeout its earlier fast answers earned and times out every time.
+        """
+        stats = self._get(scraper)
+        stats.outcomes.append(ok)
+        if ok or timed_out:
+            # Latency of other failures says nothing about how long a good answer takes
+            stats.latencies.append(round(elapsed, 3))
+        if timed_out:
+            stats.last_timeout = round(elapsed, 3)
+        if ok:
+            stats.last_timeout = 0.0
+            stats.consecutive_failures = 0
+            stats.open_until = 0.0
+        else:
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.open_until = time.time() + self.cooldown
+
+    def is_open(self, scraper: str) -> bool:
+        stats = self.stats.get(scraper)
+        return stats is not None and stats.open_until > time.time()
+
+    def cooldown_left(self, scraper: str) -> float:
+        """Seconds until an open breaker lets the shop be scraped again, 0 if closed"""
+        stats = self.stats.get(scraper)
+        if stats is None:
+            return 0.0
+        return max(0.0, stats.open_until - time.time())
+
+    def timeout_for(self, scraper: str) -> float:
+        stats = self.stats.get(scraper)
+        if stats is None or len(stats.latencies) < self.MIN_SAMPLES:
+            return self.max_timeout
+        timeout = max(percentile(stats.latencies, 0.95), stats.last_timeout) * self.timeout_factor
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def order(self, scrapers: list) -> list:
+        """Healthy, fast shops first so failing ones don't hold the concurrency slots"""
+
+        def rank(scraper):
+            stats = self.stats.get(scraper)
+            if stats is None:
+                return (False, 0.0, 0.0)
+            p50 = percentile(stats.latencies, 0.5) or self.max_timeout
+            return (self.is_open(scraper), stats.error_rate(), p50)
+
+        return sorted(scrapers, key=rank)
+
+    def summary(self) -> list:
+        """One dict per scraper, slowest p95 first"""
+        rows = []
+        for scraper, stats in self.stats.items():
+            rows.append(
+                {
+                    "scraper": scraper,
+                    "samples": len(stats.outcomes),
+                    "p50": percentile(stats.latencies, 0.5),
+                    "p95": percentile(stats.latencies, 0.95),
+                    "error_rate": stats.error_rate(),
+                    "timeout": self.timeout_for(scraper),
+                    "open": self.is_open(scraper),
+                }
+            )
+        rows.sort(key=lambda row: row["p95"] or 0.0, reverse=True)
+        return rows
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable scraper health file %s: %s", self.path, e)
+            return
+        for scraper, data in stored.items():
+            self.stats[scraper] = ScraperStats.from_json(data, self.window)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({s: stats.to_json() for s, stats in self.stats.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not write scraper health file %s: %s", self.path, e)
@@ -0,0 +1,39 @@
+from textual.widget import Widget
+from rich.panel import Panel
+from rich.table import Table
+
+
+class ScraperHealthWidget(Widget):
+    """Rolling latency, error rate and breaker state of every scraper"""
+
+    CSS_PATH = "styles.tcss"
+
+    def __init__(self, health, **kwargs):
+        super().__init__(**kwargs)
+        self.health = health
+
+    def render(self) -> Panel:
+        table = Table(expand=True, box=None)
+        table.add_column("Shop", style="yellow")
+        table.add_column("Scrapes", justify="right")
+        table.add_column("p50", justify="right")
+        table.add_column("p95", justify="right")
+        table.add_column("Errors", justify="right")
+        table.add_column("Timeout", justify="right")
+        table.add_column("State")
+
+        for row in self.health.summary():
+            table.add_row(
+                row["scraper"],
+                f"{row['samples']}",
+                f"{row['p50']:.2f}s" if row["p50"] is not None else "-",
+                f"{row['p95']:.2f}s" if row["p95"] is not None else "-",
+                f"{row['error_rate']:.0%}",
+                f"{row['timeout']:.1f}s",
+                "[red]cooling down[/red]" if row["open"] else "[green]ok[/green]",
+            )
+
+        return Panel(table, title="Shop health", expand=True)
+
+    class Meta:
+        css_class = "scraper-health-widget"
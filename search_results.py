@@ -0,0 +1,46 @@
+from typing import NamedTuple
+
+
+class CardGroup(NamedTuple):
+    """Every printing of one card name, as grouped by group_search_results()"""
+
+    name: str
+    # Search entries ({"key": ..., "metadata": {"id": ..., "released_at": ...}}),
+    # newest printing first
+    printings: list
+
+    @property
+    def card_ids(self) -> list:
+        return [p["metadata"]["id"] for p in self.printings]
+
+
+def group_search_results(results: list) -> list:
+    """Removes duplicate entries of a fetch_search_cards() response and groups printings.
+
+    Entries with the same card ID are kept once. The rest are grouped by name (ignoring
+    case), groups in the order the API ranked their first entry, printings newest first.
+
+    Args:
+        results (list): The list returned by fetch_search_cards()
+
+    Returns:
+        list: CardGroup per card name
+    """
+    groups = {}
+    seen_ids = set()
+    for entry in results or []:
+        card_id = entry.get("metadata", {}).get("id")
+        if not card_id or card_id in seen_ids:
+            continue
+        seen_ids.add(card_id)
+        key = entry["key"].casefold()
+        if key not in groups:
+            groups[key] = CardGroup(entry["key"], [])
+        groups[key].printings.append(entry)
+
+    for group in groups.values():
+        # Missing dates sort last
+        group.printings.sort(
+            key=lambda p: p["metadata"].get("released_at") or "", reverse=True
+        )
+    return list(groups.values())
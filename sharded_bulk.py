@@ -0,0 +1,294 @@
+"""Bulk pricing split across worker processes, on one machine or several.
+
+A coordinator resolves the card list to (card, scraper) jobs on a durable SQLite queue,
+any number of workers claim and scrape them, and the results are exported once the
+queue is drained. Every step can be stopped and started again.
+
+Example, everything on one machine:
+    python sharded_bulk.py run inventory.csv -o prices.csv --workers 4
+
+Example, workers on several machines sharing queue.sqlite3 over a network filesystem:
+    python sharded_bulk.py enqueue inventory.csv --queue queue.sqlite3
+    python sharded_bulk.py work --queue queue.sqlite3 --no-wal     (on every machine)
+    python sharded_bulk.py status --queue queue.sqlite3
+    python sharded_bulk.py export --queue queue.sqlite3 -o prices.csv
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from itertools import islice
+
+from app_logging import configure_logging, get_logger
+from bulk import OfferWriter, read_card_names, resolve_card_ids
+from fanout import fan_out_seller_info
+from job_queue import DEFAULT_LEASE, JobQueue, worker_name
+from magicmargins import close_async_client, fetch_mm_scrapers_list_async
+from price_aggregator import is_in_stock
+from scraper_health import CircuitOpenError, ScraperHealth
+
+logger = get_logger("sharded_bulk")
+
+
+async def enqueue_cards(
+    queue: JobQueue, input_path: str, all_printings: bool = False, batch_size: int = 20
+) -> dict:
+    """Resolves the names of a CSV/decklist and queues one job per (card, scraper) pair.
+
+    Every row is recorded, so a card listed twice under different names or quantities
+    is scraped once and exported once per row.
+    """
+    scrapers = await fetch_mm_scrapers_list_async()
+    if not scrapers:
+        raise RuntimeError("Could not fetch the scraper list")
+
+    counters = {"names": 0, "unresolved": 0, "search_errors": 0, "jobs": 0}
+    rows = (
+        (row, name, quantity)
+        for row, (name, quantity) in enumerate(read_card_names(input_path))
+    )
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        resolved = await asyncio.gather(
+            *(resolve_card_ids(name, all_printings) for _, name, _ in batch)
+        )
+        inputs = []
+        for (row, name, quantity), card_ids in zip(batch, resolved):
+            if card_ids is None:
+                # Enqueuing is idempotent, running enqueue again searches it again
+                counters["search_errors"] += 1
+                continue
+            if not card_ids:
+                logger.warning("No card found for %s", name)
+                counters["unresolved"] += 1
+            inputs.extend((row, card_id, name, quantity) for card_id in card_ids)
+        counters["names"] += len(batch)
+        # Rows and pairs already queued by an earlier enqueue are ignored
+        counters["jobs"] += queue.enqueue(inputs, scrapers)
+    return counters
+
+
+async def run_worker(
+    queue: JobQueue,
+    worker: str = None,
+    batch_size: int = 64,
+    max_concurrency: int = 32,
+    per_host_limit: int = 2,
+    timeout: float = 10.0,
+) -> dict:
+    """Claims and scrapes jobs until the queue is drained.
+
+    Results of a claimed batch are written back in one transaction. A failed scrape is
+    returned to the queue for another try, possibly by another worker. Jobs skipped
+    because their shop's circuit breaker is open go back without using up an attempt.
+
+    Returns:
+        dict: Jobs done, failed for good and deferred by this worker
+    """
+    worker = worker or worker_name()
+    health = ScraperHealth(max_timeout=timeout)
+    counters = {"done": 0, "failed": 0, "deferred": 0}
+    while True:
+        jobs = queue.claim(worker, batch_size)
+        if not jobs:
+            if queue.is_finished():
+                return counters
+            # Other workers hold the rest, wait in case one of them dies
+            await asyncio.sleep(1.0)
+            continue
+
+        results = []
+        failures = []
+        deferred = {}
+        async for result in fan_out_seller_info(
+            None,
+            None,
+            pairs=jobs,
+            max_concurrency=max_concurrency,
+            per_host_limit=per_host_limit,
+            timeout=timeout,
+            health=health,
+        ):
+            if result.error is None and result.seller_info is not None:
+                results.append((result.card_id, result.scraper_id, result.seller_info))
+            elif isinstance(result.error, CircuitOpenError):
+                deferred.setdefault(result.scraper_id, []).append(
+                    (result.card_id, result.scraper_id)
+                )
+            else:
+                error = repr(result.error) if result.error else "no answer"
+                failures.append((result.card_id, result.scraper_id, error))
+        queue.complete(results)
+        counters["failed"] += queue.fail(failures)
+        for scraper, skipped in deferred.items():
+            queue.defer(skipped, health.cooldown_left(scraper))
+            counters["deferred"] += len(skipped)
+        counters["done"] += len(results)
+        logger.info("%s: %s", worker, counters)
+
+
+def _worker_process(queue_path: str, options: dict) -> None:
+    """Entry point of a worker process started by `run`"""
+    configure_logging(options.pop("log_level"), stream=True)
+    queue = JobQueue(queue_path, lease=options.pop("lease"), wal=options.pop("wal"))
+
+    async def run():
+        try:
+            return await run_worker(queue, **options)
+        finally:
+            await close_async_client()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+
+def export_results(
+    queue: JobQueue, output_path: str, output_format: str = None, in_stock_only: bool = False
+) -> int:
+    """Writes the offers of every done job like bulk.py does, returns the row count"""
+    # A full dump every time, unlike bulk.py's output which is appended to on resume
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    writer = OfferWriter(output_path, output_format)
+    try:
+        for card_id, scraper, query, quantity, offers in queue.results():
+            for offer in offers:
+                if in_stock_only and not is_in_stock(offer):
+                    continue
+                writer.write(
+                    {
+                        **offer,
+                        "query": query,
+                        "quantity": quantity,
+                        "card_id": card_id,
+                        "scraper_id": scraper,
+                    }
+                )
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def format_progress(progress: dict, elapsed: float = None) -> str:
+    finished = progress["done"] + progress["failed"]
+    line = (
+        f"{finished}/{progress['total']} jobs, {progress['done']} done,"
+        f" {progress['failed']} failed, {progress['claimed']} in flight"
+    )
+    if elapsed:
+        line += f", {finished / elapsed:.1f} jobs/s"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk pricing across worker processes")
+    parser.add_argument("--queue", default="bulk_queue.sqlite3", help="SQLite job queue")
+    parser.add_argument("--no-wal", action="store_true", help="Needed when the queue is on a network filesystem")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="Seconds before a claimed job is handed to another worker")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue the jobs of a CSV or decklist")
+    run = commands.add_parser("run", help="Queue, scrape with local workers and export")
+    for command in (enqueue, run):
+        command.add_argument("input", help="CSV file with a name column, or a decklist")
+        command.add_argument("--all-printings", action="store_true")
+
+    work = commands.add_parser("work", help="Scrape queued jobs until none are left")
+    for command in (work, run):
+        command.add_argument("--batch-size", type=int, default=64, help="Jobs claimed at once")
+        command.add_argument("--max-concurrency", type=int, default=32)
+        command.add_argument("--per-host-limit", type=int, default=2)
+        command.add_argument("--timeout", type=float, default=10.0)
+    run.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+
+    commands.add_parser("status", help="Print the progress of the queue")
+    commands.add_parser("retry", help="Queue the jobs that ran out of attempts again")
+
+    export = commands.add_parser("export", help="Write the results to a CSV or JSONL file")
+    for command in (export, run):
+        command.add_argument("-o", "--output", required=True, help="Output .csv or .jsonl")
+        command.add_argument("--format", choices=("csv", "jsonl"))
+        command.add_argument("--in-stock-only", action="store_true")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level, stream=True)
+    queue = JobQueue(args.queue, lease=args.lease, wal=not args.no_wal)
+    try:
+        if args.command in ("enqueue", "run"):
+
+            async def enqueue_all():
+                try:
+                    return await enqueue_cards(queue, args.input, args.all_printings)
+                finally:
+                    await close_async_client()
+
+            print(asyncio.run(enqueue_all()))
+
+        if args.command == "work":
+
+            async def work_all():
+                try:
+                    return await run_worker(
+                        queue,
+                        batch_size=args.batch_size,
+                        max_concurrency=args.max_concurrency,
+                        per_host_limit=args.per_host_limit,
+                        timeout=args.timeout,
+                    )
+                finally:
+                    await close_async_client()
+
+            print(asyncio.run(work_all()))
+
+        if args.command == "run":
+            options = {
+                "batch_size": args.batch_size,
+                "max_concurrency": args.max_concurrency,
+                "per_host_limit": args.per_host_limit,
+                "timeout": args.timeout,
+                "log_level": args.log_level,
+                "lease": args.lease,
+                "wal": not args.no_wal,
+            }
+            # spawn, so every worker gets fresh clients and event loop
+            context = multiprocessing.get_context("spawn")
+            workers = [
+                context.Process(target=_worker_process, args=(args.queue, dict(options)))
+                for _ in range(args.workers)
+            ]
+            start = time.monotonic()
+            for process in workers:
+                process.start()
+            while any(process.is_alive() for process in workers):
+                time.sleep(2.0)
+                print(format_progress(queue.progress(), time.monotonic() - start))
+            for process in workers:
+                process.join()
+
+        if args.command == "status":
+            print(format_progress(queue.progress()))
+
+        if args.command == "retry":
+            print(f"{queue.retry_failed()} jobs queued again")
+
+        if args.command in ("export", "run"):
+            rows = export_results(queue, args.output, args.format, args.in_stock_only)
+            print(f"{rows} rows written to {args.output}")
+            print(format_progress(queue.progress()))
+    except KeyboardInterrupt:
+        print("Interrupted, the queue keeps its progress")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
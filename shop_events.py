@@ -0,0 +1,154 @@
+"""Per-shop progress of a price search, as a stream of typed events.
+
+fan_out_seller_info() yields raw ScrapeResults. stream_shop_events() turns them into one
+ShopEvent per state change of each (card, shop) pair, with the running done/total count,
+so a UI can show a progress bar and render each shop's offers as soon as it answers.
+"""
+
+import asyncio
+from typing import AsyncIterator, NamedTuple, Optional
+
+from fanout import ScrapeResult, fan_out_seller_info
+from scraper_health import CircuitOpenError
+
+# Event kinds. STARTED is sent when the request goes out, every other kind finishes the
+# pair and counts towards `done`
+STARTED = "started"
+OFFERS = "offers"
+EMPTY = "empty"
+TIMED_OUT = "timed_out"
+ERROR = "error"
+# Not scraped, the shop's circuit breaker is open
+SKIPPED = "skipped"
+
+# Default seconds between two frames of stream_shop_event_frames()
+FRAME_INTERVAL = 0.05
+
+
+class ShopEvent(NamedTuple):
+    """One step of a (card, shop) scrape as yielded by stream_shop_events()"""
+
+    kind: str
+    card_id: str
+    scraper_id: str
+    # Pairs finished so far, this one included, out of `total`
+    done: int
+    total: int
+    # Set for OFFERS events
+    offers: Optional[list] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+    from_store: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.kind != STARTED
+
+
+def classify(result: ScrapeResult) -> str:
+    """Event kind of a finished scrape"""
+    if isinstance(result.error, CircuitOpenError):
+        return SKIPPED
+    if isinstance(result.error, asyncio.TimeoutError):
+        return TIMED_OUT
+    if result.error is not None:
+        return ERROR
+    return OFFERS if result.seller_info else EMPTY
+
+
+async def _pump(queue: asyncio.Queue, card_ids: list, scrapers: list, **fan_out) -> None:
+    """Feeds the events of a fan-out to `queue`, then None when it is over"""
+    total = len(fan_out["pairs"]) if fan_out.get("pairs") is not None else (
+        len(card_ids) * len(scrapers)
+    )
+    done = 0
+
+    def on_start(card_id: str, scraper: str) -> None:
+        queue.put_nowait(ShopEvent(STARTED, card_id, scraper, done, total))
+
+    try:
+        async for result in fan_out_seller_info(
+            card_ids, scrapers, on_start=on_start, **fan_out
+        ):
+            done += 1
+            queue.put_nowait(
+                ShopEvent(
+                    classify(result),
+                    result.card_id,
+                    result.scraper_id,
+                    done,
+                    total,
+                    offers=result.seller_info,
+                    error=result.error,
+                    elapsed=result.elapsed,
+                    from_store=result.from_store,
+                )
+            )
+    finally:
+        queue.put_nowait(None)
+
+
+async def _frames(card_ids: list, scrapers: list, fan_out: dict, frame_interval: float):
+    queue = asyncio.Queue()
+    pump = asyncio.create_task(_pump(queue, card_ids, scrapers, **fan_out))
+    loop = asyncio.get_running_loop()
+    last_frame = float("-inf")
+    try:
+        while True:
+            event = await queue.get()
+            if frame_interval:
+                # The first event of a frame is sent right away when the UI is idle,
+                # anything arriving while it waits is sent along with it
+                wait = last_frame + frame_interval - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            frame = [event]
+            while not queue.empty():
+                frame.append(queue.get_nowait())
+            ended = frame[-1] is None
+            if ended:
+                frame.pop()
+            if frame:
+                yield frame
+                # Only results throttle the next frame, so the first answer isn't held
+                # back by the STARTED events sent just before it
+                if any(event.kind != STARTED for event in frame):
+                    last_frame = loop.time()
+            if ended:
+                break
+        # Re-raises whatever stopped the fan-out
+        await pump
+    finally:
+        pump.cancel()
+        await asyncio.gather(pump, return_exceptions=True)
+
+
+async def stream_shop_events(
+    card_ids: list, scrapers: list, **fan_out
+) -> AsyncIterator[ShopEvent]:
+    """Scrapes like fan_out_seller_info() and yields a ShopEvent per step of every pair.
+
+    Args:
+        card_ids (list): Card UUIDs taken from fetch_search_cards()
+        scrapers (list): Scraper IDs taken from fetch_mm_scrapers_list()
+        **fan_out: Passed on to fan_out_seller_info() (health, store, timeout, ...)
+
+    Yields:
+        ShopEvent: STARTED when a shop is asked, then one of OFFERS, EMPTY, TIMED_OUT,
+            ERROR or SKIPPED when it is done
+    """
+    async for frame in _frames(card_ids, scrapers, fan_out, 0.0):
+        for event in frame:
+            yield event
+
+
+async def stream_shop_event_frames(
+    card_ids: list, scrapers: list, frame_interval: float = FRAME_INTERVAL, **fan_out
+) -> AsyncIterator[list]:
+    """Same events as stream_shop_events(), batched so at most one list per frame_interval.
+
+    A UI applies each list in one update instead of redrawing per shop. The first
+    offers still show up as soon as the fastest shop answers.
+    """
+    async for frame in _frames(card_ids, scrapers, fan_out, frame_interval):
+        yield frame
@@ -1,3 +1,6 @@
+import os
+
+
 def prettify_print(objects: dict) -> None:
     print(objects.items())
 
@@ -16,3 +19,20 @@ def print_hash(num: int, char="#"):
         return num * char
     except ValueError:
         print(f"Invalid")
+
+
+def get_cache_dir() -> str:
+    """Directory for on-disk caches, override with the MAGICSCRAPER_CACHE_DIR env var"""
+    if os.environ.get("MAGICSCRAPER_CACHE_DIR"):
+        return os.environ["MAGICSCRAPER_CACHE_DIR"]
+    from platformdirs import user_cache_dir
+
+    return user_cache_dir("MagicScraper")
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile, q between 0 and 1. Returns None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[round(q * (len(ordered) - 1))]